@@ -0,0 +1,116 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache():
+    def __init__(self, embeddings_model, threshold: float = 0.92, max_entries: int = 500, ttl_seconds: float = 3600):
+        '''
+        Answer cache keyed by query meaning rather than exact text.
+
+        Incoming queries are embedded and compared (cosine similarity) with the queries of previously answered
+        requests; above the threshold the stored answer and context are returned instead of running the agent.
+        Entries are evicted by LRU (max_entries) and TTL, and invalidate() drops everything when the corpus changes.
+        Each invalidation starts a new generation: an answer is only stored if no invalidation happened since its
+        request looked up the cache, so answers built from the old corpus are not cached after the change.
+        Entries are shared by all sessions, so only messages that do not depend on earlier turns may use the
+        cache (see LangGraphAgent._lookup_answer_cache).
+
+        Args:
+            embeddings_model: The embeddings model used to embed queries (LangChain Embeddings).
+            threshold (float): The minimum cosine similarity for a hit.
+            max_entries (int): The maximum number of cached answers.
+            ttl_seconds (float): The time after which an answer expires.
+        '''
+        self.embeddings_model = embeddings_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> {"embedding", "answer", "context", "created_at", "latency"}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_seconds = 0.0
+
+    async def aembed(self, query: str) -> np.ndarray:
+        embedding = np.asarray(await self.embeddings_model.aembed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def lookup(self, query_embedding: np.ndarray, lookup_latency: float = 0.0):
+        '''
+        Returns the cached reply (answer, context) of the most similar previous query, or None.
+
+        Args:
+            query_embedding (np.ndarray): The normalized query embedding (see aembed).
+            lookup_latency (float): The time spent embedding the query, deducted from the latency saved.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            best_key, best_score = None, -1.0
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.stack([self._entries[key]["embedding"] for key in keys])
+                scores = matrix @ query_embedding
+                best = int(np.argmax(scores))
+                best_key, best_score = keys[best], float(scores[best])
+
+            if best_key is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.latency_saved_seconds += max(entry["latency"] - lookup_latency, 0.0)
+            return {"answer": entry["answer"], "context": entry["context"], "similarity": best_score}
+
+    def store(self, query_embedding: np.ndarray, answer: str, context: dict, latency: float, generation: int):
+        '''
+        Caches the answer and context produced for a query, with the latency it took to produce them.
+        generation is the cache generation read before the lookup: the answer is dropped if the cache was
+        invalidated since.
+        '''
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[self._next_key] = {
+                "embedding": query_embedding,
+                "answer": answer,
+                "context": context,
+                "created_at": time.monotonic(),
+                "latency": latency
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        '''
+        Drops every cached answer (e.g. after the corpus changed).
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved_seconds
+        }
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
@@ -1,38 +1,86 @@
 # Import required FastAPI components for building the API
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 # Import Pydantic for data validation and settings management
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 # Import OpenAI client for interacting with OpenAI's API
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import os
 import sys
+import json
+import threading
 
 # Add the current directory to Python path for Vercel compatibility
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
-# Import langgraph_agent with error handling for deployment
-try:
-    from langgraph_agent import LangGraphAgent, RetrievalEnums
-except ImportError:
-    # Fallback for different import paths
+from startup import StartupTracker
+from metrics import REGISTRY
+
+# The agent (and the LangGraph / LangChain / retrieval stack it imports) is built in a background thread once
+# the server is up, so the port is bound immediately; /api/ready reports the initialization progress
+startup = StartupTracker()
+Agent = None
+# Seconds an agent request waits for the initialization before answering 503. Serverless runtimes (Vercel) start
+# a cold instance on the request itself, so they wait by default
+AGENT_READY_TIMEOUT_SECONDS = float(os.getenv("AGENT_READY_TIMEOUT_SECONDS", "60" if os.getenv("VERCEL") else "0"))
+
+def build_agent():
+    global Agent
     try:
-        import langgraph_agent as langgraph_agent
-        LangGraphAgent = langgraph_agent.LangGraphAgent
-        RetrievalEnums = langgraph_agent.RetrievalEnums
-    except ImportError:
-        print("Warning: LangGraphAgent could not be imported")
+        startup.begin("imports")
+        # Import langgraph_agent with error handling for deployment
+        try:
+            from langgraph_agent import LangGraphAgent, RetrievalEnums
+        except ImportError:
+            # Fallback for different import paths
+            import langgraph_agent as langgraph_agent
+            LangGraphAgent = langgraph_agent.LangGraphAgent
+            RetrievalEnums = langgraph_agent.RetrievalEnums
 
+        # Initialize LangGraphAgent
+        Agent = LangGraphAgent(retriever_mode=RetrievalEnums.PARENT_DOCUMENT, 
+                               MODE="CHALLENGE", 
+                               langchain_project_name= "AIM-CERT-LANGGRAPH-PARENT",
+                               answer_cache_config={
+                                   "enabled": os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true",
+                                   "params": {
+                                       "threshold": float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+                                       "max_entries": int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500")),
+                                       "ttl_seconds": float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+                                   }
+                               },
+                               startup_tracker=startup)
+        startup.mark_ready()
+    except Exception as e:
+        print(f"Agent initialization failed: {str(e)}")
+        startup.mark_failed(getattr(e, "detail", e))
 
-# Initialize FastAPI application with a title
-app = FastAPI(title="ParentALLm Agent")
+def start_agent_initialization():
+    if startup.start():
+        threading.Thread(target=build_agent, name="agent-init", daemon=True).start()
 
-# Initialize LangGraphAgent
-Agent = LangGraphAgent(retriever_mode=RetrievalEnums.PARENT_DOCUMENT, 
-                       MODE="CHALLENGE", 
-                       langchain_project_name= "AIM-CERT-LANGGRAPH-PARENT")
+async def get_agent():
+    # Runtimes without lifespan support start the initialization on the first request
+    start_agent_initialization()
+    if not startup.ready and AGENT_READY_TIMEOUT_SECONDS > 0:
+        await run_in_threadpool(startup.wait, AGENT_READY_TIMEOUT_SECONDS)
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail=f"Agent not ready (phase: {startup.phase})")
+    return Agent
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_agent_initialization()
+    yield
+
+# Initialize FastAPI application with a title
+app = FastAPI(title="ParentALLm Agent", lifespan=lifespan)
 
 # Configure CORS (Cross-Origin Resource Sharing) middleware
 # This allows the API to be accessed from different domains/origins
@@ -48,13 +96,18 @@ app.add_middleware(
 # This ensures incoming request data is properly validated
 class ChatRequest(BaseModel):
     user_message: str      # Message from the user
+    session_id: str = "default"   # Conversation session (memory is kept per session)
+
+class ClearMemoryRequest(BaseModel):
+    session_id: str = "default"   # Conversation session whose memory is cleared
 
 # Define the main chat endpoint that handles POST requests
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
+    agent = await get_agent()
     try:
         
-        reply = await Agent.chat(request.user_message)
+        reply = await agent.chat(request.user_message, session_id=request.session_id)
         return {
             "response": reply["response"],
             "context": reply.get("context", {})
@@ -64,20 +117,114 @@ async def chat(request: ChatRequest):
         # Handle any errors that occur during processing
         raise HTTPException(status_code=500, detail=str(e))
 
-# Define a health check endpoint to verify API status
+def format_sse(event: str, data: Dict) -> str:
+    # Server-Sent Events wire format: one event per block, JSON payload
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Define the streaming chat endpoint (Server-Sent Events)
+# Events: token, tool_start, tool_end, final (or error)
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    agent = await get_agent()
+
+    async def event_stream():
+        try:
+            async for event, data in agent.chat_stream(request.user_message, session_id=request.session_id):
+                yield format_sse(event, data)
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Define a health check endpoint to verify API status (liveness: the process is up and serving)
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
+# Define a readiness endpoint: 200 once the agent is initialized, 503 (with the current phase) before that
+@app.get("/api/ready")
+async def ready_check():
+    status = startup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# Define an endpoint exposing the Prometheus metrics (node, retrieval and upstream latencies, tool calls, tokens)
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Define an endpoint exposing the answer cache metrics (hit rate, latency saved)
+@app.get("/api/answer-cache/stats")
+async def answer_cache_stats():
+    return (await get_agent()).get_answer_cache_stats()
+
 # Define an endpoint to clear agent memory
 @app.post("/api/clear-memory")
-async def clear_memory():
+async def clear_memory(request: Optional[ClearMemoryRequest] = None):
+    agent = await get_agent()
     try:
-        Agent.reset_longer_term_memory()
+        agent.reset_longer_term_memory(session_id=(request or ClearMemoryRequest()).session_id)
         return {"status": "memory_cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Define the data models for the knowledge base admin endpoints
+class AdminDocument(BaseModel):
+    id: str                               # Stable document ID (e.g. "data_toddlers_1p5-3/009_Feeding Your Toddler.txt")
+    page_content: str                     # Document text
+    metadata: Dict = {}                   # Optional metadata (e.g. source)
+
+class UpsertDocumentsRequest(BaseModel):
+    documents: List[AdminDocument]
+
+class DeleteDocumentsRequest(BaseModel):
+    ids: List[str]
+
+def check_admin_token(admin_token: Optional[str]):
+    # Admin endpoints are disabled unless ADMIN_API_TOKEN is set
+    expected = os.getenv("ADMIN_API_TOKEN")
+    if not expected or admin_token != expected:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    # With several workers (see serve.py) an update would only reach the worker handling the request
+    if int(os.getenv("SERVE_WORKERS", "1")) > 1:
+        raise HTTPException(status_code=409, detail="Document updates are disabled with multiple workers: rebuild the index snapshot and restart")
+
+# Define an endpoint to insert or replace knowledge base documents
+@app.post("/api/admin/documents")
+async def upsert_documents(request: UpsertDocumentsRequest, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    agent = await get_agent()
+    try:
+        from langchain_core.documents import Document
+        documents = [
+            Document(page_content=doc.page_content, metadata={"source": doc.id, **doc.metadata, "doc_id": doc.id})
+            for doc in request.documents
+        ]
+        # embeddings API and index updates are blocking: keep them off the event loop
+        stats = await run_in_threadpool(agent.upsert_documents, documents)
+        return {"status": "documents_upserted", **stats}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Define an endpoint to delete knowledge base documents
+@app.delete("/api/admin/documents")
+async def delete_documents(request: DeleteDocumentsRequest, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    agent = await get_agent()
+    try:
+        deleted = await run_in_threadpool(agent.delete_documents, request.ids)
+        return {"status": "documents_deleted", "documents": deleted}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Entry point for running the application directly
 if __name__ == "__main__":
     import uvicorn
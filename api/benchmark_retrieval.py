@@ -0,0 +1,245 @@
+"""
+Offline retrieval benchmark.
+
+    cd api && python benchmark_retrieval.py --output benchmark.json
+
+Runs every retrieval mode (the RetrievalEnums values, see retrievers.RETRIEVAL_CHAIN_COMPONENTS) over the
+questions of eval_golden_dataset.pkl through get_retrieval_chains_and_wrappers, with deterministic local fake
+embeddings, chat and rerank models, so it needs no network and no API keys. For each mode it reports the build
+time, the p50/p95/p99 query latency, the queries per second and the peak RSS, as JSON.
+
+Each mode runs in its own subprocess so that peak RSS and caches are not shared between modes. The numbers
+measure our retrieval code, not answer quality (see the proto_agent_eval_*.ipynb RAGAS notebooks for that).
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import resource
+import tempfile
+import subprocess
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from bm25 import tokenize
+from query_embedding_cache import QueryEmbeddingCache
+from retrievers import RETRIEVAL_CHAIN_COMPONENTS, get_retrieval_chains_and_wrappers
+from utils import get_parent_dir
+
+# No LangSmith traces from the benchmark
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+os.environ["LANGSMITH_TRACING"] = "false"
+
+
+# ===============================
+# Deterministic local models
+# ===============================
+
+class HashingEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings: deterministic, local, and similar texts get similar vectors.
+    """
+
+    def __init__(self, dim: int = 1536):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers with deterministic variants of the last prompt line (the question, for the multi-query prompt).
+    """
+
+    n_variants: int = 3
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-fake-chat"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        last_line = str(messages[-1].content).strip().splitlines()[-1]
+        question = last_line.split(":", 1)[-1].strip()
+        variants = [question, f"{question} explained", f"examples of {question}", f"{question} for parents"]
+        content = "\n".join(variants[:self.n_variants])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+class LexicalReranker():
+    """
+    Rerank API stand-in (same interface as CohereRerank.rerank): scores by query term overlap.
+    """
+
+    def rerank(self, documents: List[str], query: str, top_n: Optional[int] = None) -> List[dict]:
+        query_terms = set(tokenize(query))
+        scores = [len(query_terms & set(tokenize(doc))) / (len(query_terms) or 1) for doc in documents]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [{"index": i, "relevance_score": scores[i]} for i in order]
+
+
+# ===============================
+# Benchmark
+# ===============================
+
+def load_questions(golden_dataset_path: str, max_queries: Optional[int] = None) -> List[str]:
+    # ragas Testset: one TestsetSample per row, the question is eval_sample.user_input
+    with open(golden_dataset_path, "rb") as f:
+        golden_dataset = pickle.load(f)
+    questions = [row.eval_sample.user_input for row in golden_dataset]
+    return questions[:max_queries] if max_queries else questions
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(chain_name: str, dataset_name: str, questions: List[str], vector_backend: str, passes: int) -> dict:
+    """
+    Builds the indexes and the retriever for one mode, then times every question through its chain.
+    """
+    from data_loader import DataLoader
+    from vector_stores import VectorStoresManager
+
+    start = time.perf_counter()
+    loaded_data = DataLoader(dataset_name).load_data()
+    embeddings_model = QueryEmbeddingCache(HashingEmbeddings(), model_name="benchmark-hashing")
+    chat_model = FakeChatModel()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dbs_manager = VectorStoresManager(
+            MODE="baseline",
+            loaded_data=loaded_data,
+            chunk_config={"enabled": True, "params": {"chunk_size": 1000, "chunk_overlap": 200}},
+            chat_model=chat_model,
+            embeddings_cache_dir=cache_dir,
+            vector_backend=vector_backend,
+            embeddings_model=embeddings_model
+        )
+        index_build_seconds = time.perf_counter() - start
+
+        # same layout as LangGraphAgent._initialization, with the local reranker
+        retrievers_config = {
+            "base": {
+                "get_vectorstore": dbs_manager.get_base_vectorstore
+            },
+            "parent_document": {
+                "vectorstore": dbs_manager.get_parent_document_vectorstore(),
+                "in_memory_store": dbs_manager.get_in_memory_store(),
+                "child_splitter": dbs_manager.get_child_splitter(),
+                "ingest_embeddings": dbs_manager.ingest_child_embeddings
+            },
+            "bm25": {
+                "documents": dbs_manager.get_chunked_loaded_data()
+            },
+            "contextual_compression": {
+                "reranker": LexicalReranker()
+            }
+        }
+
+        start = time.perf_counter()
+        chains, _ = get_retrieval_chains_and_wrappers(
+            retrievers_config, dbs_manager.get_loaded_data(), chat_model, "BENCHMARK", modes=[chain_name]
+        )
+        chain = chains[chain_name]
+        retriever_build_seconds = time.perf_counter() - start
+
+        latencies = []
+        run_start = time.perf_counter()
+        for _ in range(passes):
+            for question in questions:
+                query_start = time.perf_counter()
+                chain.invoke({"question": question})
+                latencies.append(time.perf_counter() - query_start)
+        run_seconds = time.perf_counter() - run_start
+
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        "index_build_seconds": round(index_build_seconds, 3),
+        "retriever_build_seconds": round(retriever_build_seconds, 3),
+        "build_seconds": round(index_build_seconds + retriever_build_seconds, 3),
+        "queries": len(latencies),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "mean": round(float(latencies_ms.mean()), 3)
+        },
+        "qps": round(len(latencies) / run_seconds, 2) if run_seconds else None,
+        "peak_rss_mb": round(get_peak_rss_mb(), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark over eval_golden_dataset.pkl (no network).")
+    parser.add_argument("--dataset", default="pd_blogs_filtered")
+    parser.add_argument("--golden-dataset", default=os.path.join(get_parent_dir(__file__), "api", "eval_golden_dataset.pkl"))
+    parser.add_argument("--modes", nargs="*", default=list(RETRIEVAL_CHAIN_COMPONENTS),
+                        help="Retrieval chain names (RetrievalEnums values); all by default")
+    parser.add_argument("--vector-backend", default="qdrant", choices=["qdrant", "numpy"])
+    parser.add_argument("--max-queries", type=int, default=None)
+    parser.add_argument("--passes", type=int, default=1, help="Passes over the questions (later passes hit the caches)")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--in-process", action="store_true", help="Run every mode in this process (shared peak RSS)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.golden_dataset, args.max_queries)
+    report = {
+        "dataset": args.dataset,
+        "golden_dataset": os.path.basename(args.golden_dataset),
+        "vector_backend": args.vector_backend,
+        "questions": len(questions),
+        "passes": args.passes,
+        "modes": {}
+    }
+
+    for chain_name in args.modes:
+        if chain_name not in RETRIEVAL_CHAIN_COMPONENTS:
+            raise ValueError(f"Invalid retrieval mode: {chain_name}")
+        if args.in_process:
+            report["modes"][chain_name] = run_mode(chain_name, args.dataset, questions, args.vector_backend, args.passes)
+            continue
+
+        # one fresh process per mode: isolated peak RSS, cold caches
+        command = [
+            sys.executable, os.path.abspath(__file__), "--in-process", "--modes", chain_name,
+            "--dataset", args.dataset, "--golden-dataset", args.golden_dataset,
+            "--vector-backend", args.vector_backend, "--passes", str(args.passes)
+        ]
+        if args.max_queries:
+            command += ["--max-queries", str(args.max_queries)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        report["modes"][chain_name] = json.loads(output)["modes"][chain_name]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+from collections import Counter
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Shared BM25 tokenizer (indexing and queries): lowercased word characters.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index():
+    def __init__(self, vocabulary: dict, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray,
+                 doc_len: np.ndarray, documents: List[Document], k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = tokenize):
+        '''
+        BM25 (Okapi, non-negative idf) over a precomputed sparse term-document matrix.
+
+        The matrix is stored in CSR layout with one row per term: row t holds the documents containing t and
+        the full BM25 weight idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)). Scoring a query is
+        therefore a sparse matrix-vector product (query term counts x matrix), computed with one bincount, and a
+        batch of queries is scored in one sparse matrix-matrix product (see score_batch).
+
+        Use BM25Index.from_documents to build an index, and save/load to persist it.
+
+        Args:
+            vocabulary (dict): Term -> row of the matrix.
+            indptr (np.ndarray): CSR row pointers (len(vocabulary) + 1).
+            indices (np.ndarray): CSR column (document) indices.
+            data (np.ndarray): CSR BM25 weights.
+            doc_len (np.ndarray): The number of tokens of each document.
+            documents (list[Document]): The indexed documents (e.g. chunks), in column order.
+            k1 (float): The term frequency saturation parameter.
+            b (float): The document length normalization parameter.
+            tokenizer (Callable): The tokenizer used for the documents, and therefore for the queries.
+        '''
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.doc_len = doc_len
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], k1: float = 1.5, b: float = 0.75,
+                       tokenizer: Callable[[str], List[str]] = tokenize) -> "BM25Index":
+        documents = list(documents)
+        n_docs = len(documents)
+        vocabulary, rows, cols, tfs = {}, [], [], []
+        doc_len = np.zeros(n_docs, dtype=np.float32)
+
+        for j, doc in enumerate(documents):
+            counts = Counter(tokenizer(doc.page_content))
+            doc_len[j] = sum(counts.values())
+            for term, tf in counts.items():
+                rows.append(vocabulary.setdefault(term, len(vocabulary)))
+                cols.append(j)
+                tfs.append(tf)
+
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+
+        df = np.bincount(rows, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+        avgdl = float(doc_len.mean()) if n_docs and doc_len.mean() > 0 else 1.0
+        weights = idf[rows] * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_len[cols] / avgdl))
+
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=indptr[1:])
+
+        return cls(vocabulary, indptr, cols[order], weights[order].astype(np.float32), doc_len, documents,
+                   k1=k1, b=b, tokenizer=tokenizer)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Returns the BM25 score of every document for the query.
+        """
+        return self.score_batch([query])[0]
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """
+        Returns the scores of a batch of queries (n_queries x n_documents).
+
+        The batch is scored in one sparse product: the (query, term) pairs of all the queries select their
+        CSR rows, and every posting is accumulated into the flat score matrix with a single bincount.
+        """
+        n_docs = len(self.documents)
+        pairs = [
+            (i, self.vocabulary[term], count)
+            for i, query in enumerate(queries)
+            for term, count in Counter(self.tokenizer(query)).items() if term in self.vocabulary
+        ]
+        if not pairs:
+            return np.zeros((len(queries), n_docs), dtype=np.float32)
+
+        query_rows, terms, counts = (np.asarray(column) for column in zip(*pairs))
+        starts = self.indptr[terms]
+        lengths = self.indptr[terms + 1] - starts
+        # positions of all the selected postings: each pair's CSR row range, concatenated
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()))
+
+        flat = np.repeat(query_rows, lengths) * n_docs + self.indices[positions]
+        weights = self.data[positions] * np.repeat(counts, lengths)
+        scores = np.bincount(flat, weights=weights, minlength=len(queries) * n_docs)
+        return scores.reshape(len(queries), n_docs)
+
+    def top_k(self, scores: np.ndarray, k: int) -> List[Document]:
+        k = min(k, len(self.documents))
+        if k == 0:
+            return []
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ordered = candidates[np.argsort(-scores[candidates])]
+        return [self.documents[i] for i in ordered if scores[i] > 0]
+
+    def search(self, query: str, k: int = 4) -> List[Document]:
+        return self.top_k(self.score(query), k)
+
+    def search_batch(self, queries: List[str], k: int = 4) -> List[List[Document]]:
+        return [self.top_k(scores, k) for scores in self.score_batch(queries)]
+
+    # ===============================
+    # Persistence
+    # ===============================
+
+    def save(self, folder: str):
+        """
+        Saves the index into folder (bm25.<array>.npy arrays, bm25_vocabulary.json, bm25_documents.jsonl).
+        The tokenizer is not saved: the shared tokenize function is used when loading.
+        """
+        os.makedirs(folder, exist_ok=True)
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "data": self.data,
+            "doc_len": self.doc_len,
+            "params": np.asarray([self.k1, self.b], dtype=np.float64)
+        }
+        # one .npy file per array so they can be memory-mapped (and shared between workers) when loading
+        for name, array in arrays.items():
+            np.save(os.path.join(folder, f"bm25.{name}.npy"), array)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(folder, "bm25_vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f)
+        with open(os.path.join(folder, "bm25_documents.jsonl"), "w", encoding="utf-8") as f:
+            for doc in self.documents:
+                f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+
+    @classmethod
+    def load(cls, folder: str, texts: Optional[dict] = None) -> "BM25Index":
+        """
+        Loads an index saved with save. Document texts already in texts (text -> shared string, e.g. the chunk
+        texts of a loaded snapshot) are reused instead of being held twice.
+        """
+        arrays = {
+            name: np.load(os.path.join(folder, f"bm25.{name}.npy"), mmap_mode="r")
+            for name in ("indptr", "indices", "data", "doc_len", "params")
+        }
+        with open(os.path.join(folder, "bm25_vocabulary.json"), "r", encoding="utf-8") as f:
+            vocabulary = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(folder, "bm25_documents.jsonl"), "r", encoding="utf-8") as f:
+            documents = []
+            for line in f:
+                record = json.loads(line)
+                if texts is not None:
+                    record["page_content"] = texts.setdefault(record["page_content"], record["page_content"])
+                documents.append(Document(**record))
+        k1, b = arrays["params"]
+        return cls(vocabulary, arrays["indptr"], arrays["indices"], arrays["data"], arrays["doc_len"], documents,
+                   k1=float(k1), b=float(b))
+
+
+class SparseBM25Retriever(BaseRetriever):
+    """
+    Retriever over a BM25Index. The index can be swapped at runtime (e.g. after documents were upserted).
+    """
+
+    index: BM25Index
+    k: int = 4
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], k: int = 4, k1: float = 1.5, b: float = 0.75) -> "SparseBM25Retriever":
+        return cls(index=BM25Index.from_documents(documents, k1=k1, b=b), k=k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search(query, k=self.k)
+
+    def batch_search(self, queries: List[str]) -> List[List[Document]]:
+        return self.index.search_batch(queries, k=self.k)
@@ -0,0 +1,166 @@
+import os
+import json
+import mmap
+import threading
+from collections.abc import Sequence
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.stores import BaseStore
+
+
+class CompactDocStore(BaseStore[str, Document]):
+    def __init__(self, buffer=b"", offsets: Optional[np.ndarray] = None, ids: Optional[List[str]] = None,
+                 metadatas: Optional[List[dict]] = None):
+        '''
+        Parent docstore keeping the corpus as one UTF-8 buffer instead of one Document object per parent.
+
+        Each row is an (offset, length) pair into the buffer plus a metadata entry in a side table. Page contents
+        are read zero-copy through a memoryview and only decoded when a document is returned. A loaded store
+        (see CompactDocStore.load) serves a read-only memory-mapped file, so its pages are loaded lazily and
+        shared between worker processes. Writes (ingestion, upserts) are appended to an in-process tail buffer;
+        deleted or replaced rows are dropped from the index and compacted away by save.
+
+        Args:
+            buffer: The base corpus buffer (bytes or a read-only mmap).
+            offsets (np.ndarray): The (offset, length) of every base row in the buffer (n x 2).
+            ids (list[str]): The parent ID of every base row.
+            metadatas (list[dict]): The metadata of every base row.
+        '''
+        self._base = buffer
+        self._base_offsets = offsets if offsets is not None else np.zeros((0, 2), dtype=np.int64)
+        self._n_base = len(self._base_offsets)
+        self._tail = bytearray()
+        self._tail_offsets = []
+        self._metadatas = list(metadatas or [])
+        self._row_ids = list(ids or [])
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        # bumped on every write, so views can cache the key order (see DocumentsView)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _read(self, row: int) -> Document:
+        if row < self._n_base:
+            offset, length = self._base_offsets[row]
+            with memoryview(self._base) as view:
+                page_content = str(view[offset:offset + length], "utf-8")
+        else:
+            # the tail can grow concurrently: read it under the lock (a resize fails while a view is exported)
+            with self._lock:
+                offset, length = self._tail_offsets[row - self._n_base]
+                with memoryview(self._tail) as view:
+                    page_content = str(view[offset:offset + length], "utf-8")
+        return Document(page_content=page_content, metadata=dict(self._metadatas[row]))
+
+    # ===============================
+    # BaseStore interface
+    # ===============================
+
+    def mget(self, keys: List[str]) -> List[Optional[Document]]:
+        rows = [self._rows.get(key) for key in keys]
+        return [self._read(row) if row is not None else None for row in rows]
+
+    def mset(self, key_value_pairs: List[Tuple[str, Document]]) -> None:
+        with self._lock:
+            for key, doc in key_value_pairs:
+                content = doc.page_content.encode("utf-8")
+                self._tail_offsets.append((len(self._tail), len(content)))
+                self._tail.extend(content)
+                self._metadatas.append(dict(doc.metadata))
+                self._row_ids.append(key)
+                self._rows[key] = len(self._row_ids) - 1
+            self.version += 1
+
+    def mdelete(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._rows.pop(key, None)
+            self.version += 1
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        for key in list(self._rows):
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+    def as_sequence(self) -> "DocumentsView":
+        """
+        Returns a read-only sequence of the stored documents, decoded on access (e.g. to serve as the loaded data).
+        """
+        return DocumentsView(self)
+
+    # ===============================
+    # Persistence
+    # ===============================
+
+    def save(self, folder: str, name: str = "docstore"):
+        """
+        Writes the live rows into folder ({name}.bin corpus, {name}.offsets.npy, {name}.meta.jsonl side table).
+        """
+        os.makedirs(folder, exist_ok=True)
+        live_rows = sorted(self._rows.values())
+        offsets = np.zeros((len(live_rows), 2), dtype=np.int64)
+
+        with open(os.path.join(folder, f"{name}.bin"), "wb") as corpus, \
+                open(os.path.join(folder, f"{name}.meta.jsonl"), "w", encoding="utf-8") as meta:
+            position = 0
+            for i, row in enumerate(live_rows):
+                content = self._read(row).page_content.encode("utf-8")
+                corpus.write(content)
+                offsets[i] = (position, len(content))
+                position += len(content)
+                meta.write(json.dumps({"id": self._row_ids[row], "metadata": self._metadatas[row]}) + "\n")
+
+        np.save(os.path.join(folder, f"{name}.offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, folder: str, name: str = "docstore") -> "CompactDocStore":
+        with open(os.path.join(folder, f"{name}.bin"), "rb") as f:
+            # mmap cannot map an empty file
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        offsets = np.load(os.path.join(folder, f"{name}.offsets.npy"), mmap_mode="r")
+        ids, metadatas = [], []
+        with open(os.path.join(folder, f"{name}.meta.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                metadatas.append(record["metadata"])
+        return cls(buffer, offsets, ids, metadatas)
+
+
+class DocumentsView(Sequence):
+    """
+    Read-only, live view of the documents of a CompactDocStore, in insertion order.
+
+    The key order is built once and only rebuilt after the store changed, so indexing is O(1).
+    """
+
+    def __init__(self, store: CompactDocStore):
+        self.store = store
+        self._keys = []
+        self._keys_version = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def _get_keys(self) -> List[str]:
+        if self._keys_version != self.store.version:
+            version = self.store.version
+            self._keys = list(self.store.yield_keys())
+            self._keys_version = version
+        return self._keys
+
+    def __getitem__(self, index):
+        keys = self._get_keys()
+        if isinstance(index, slice):
+            return self.store.mget(keys[index])
+        return self.store.mget([keys[index]])[0]
+
+    def __iter__(self):
+        for key in self.store.yield_keys():
+            doc = self.store.mget([key])[0]
+            if doc is not None:
+                yield doc
@@ -0,0 +1,159 @@
+import os
+import re
+from typing import List
+
+from langchain_core.documents import Document
+
+from bm25 import tokenize
+from utils import count_tokens, truncate_to_tokens
+
+# Passages cut to fewer tokens than this are dropped instead
+MIN_PASSAGE_TOKENS = 50
+# Passages sharing at least this fraction of the shorter one's word 5-grams are near duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+_LINE_BREAKS = re.compile(r"\s*\n\s*")
+_SPACES = re.compile(r"[ \t]+")
+
+
+def get_source_tag(doc: Document) -> str:
+    """
+    Returns a short source tag for a passage: the file name of its source, without folders and extension.
+    """
+    source = str(doc.metadata.get("source") or doc.metadata.get("doc_id") or "")
+    name = os.path.splitext(os.path.basename(source))[0]
+    return name or "unknown"
+
+
+def compact_text(text: str) -> str:
+    """
+    Collapses runs of spaces, blank lines and indentation.
+    """
+    return _LINE_BREAKS.sub("\n", _SPACES.sub(" ", text)).strip()
+
+
+def merge_overlapping_chunks(docs: List[Document]) -> List[Document]:
+    """
+    Merges retrieved chunks of the same source that overlap or touch into one span.
+
+    Chunks are located with their stored character offset (metadata["start_index"], see VectorStoresManager);
+    chunks without one are passed through. A merged span takes the rank of its best ranked chunk.
+
+    Args:
+        docs (list[Document]): The retrieved documents, best first.
+
+    Returns:
+        list[Document]: The merged documents, best first.
+    """
+    spans_by_source, ranked = {}, []
+    for rank, doc in enumerate(docs):
+        start = doc.metadata.get("start_index")
+        source = doc.metadata.get("doc_id") or doc.metadata.get("source")
+        if start is None or source is None:
+            ranked.append((rank, doc))
+        else:
+            spans_by_source.setdefault(source, []).append((int(start), rank, doc))
+
+    for spans in spans_by_source.values():
+        spans.sort(key=lambda span: span[0])
+        start, rank, doc = spans[0]
+        text, members = doc.page_content, [doc]
+        for next_start, next_rank, next_doc in spans[1:]:
+            end = start + len(text)
+            if next_start <= end:
+                # overlapping (or adjacent) chunk: append only the part past the current span
+                text += next_doc.page_content[end - next_start:]
+                rank = min(rank, next_rank)
+                members.append(next_doc)
+                continue
+            ranked.append((rank, _merged_document(text, start, members)))
+            start, rank, text, members = next_start, next_rank, next_doc.page_content, [next_doc]
+        ranked.append((rank, _merged_document(text, start, members)))
+
+    ranked.sort(key=lambda pair: pair[0])
+    return [doc for _, doc in ranked]
+
+
+def _merged_document(text: str, start: int, members: List[Document]) -> Document:
+    if len(members) == 1:
+        return members[0]
+    metadata = {**members[0].metadata, "start_index": start, "merged_chunks": len(members)}
+    scores = [doc.metadata["relevance_score"] for doc in members if "relevance_score" in doc.metadata]
+    if scores:
+        metadata["relevance_score"] = max(scores)
+    return Document(page_content=text, metadata=metadata)
+
+
+def _shingles(text: str) -> set:
+    words = tokenize(text)
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def collapse_near_duplicates(docs: List[Document], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Document]:
+    """
+    Drops passages that are near copies of (or contained in) a better ranked one, e.g. the same article
+    stored under several age folders.
+
+    Args:
+        docs (list[Document]): The retrieved documents, best first.
+        threshold (float): The minimum fraction of the shorter passage's word 5-grams found in the other one.
+
+    Returns:
+        list[Document]: The kept documents, best first.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if not shingles:
+            continue
+        if any(len(shingles & other) / min(len(shingles), len(other)) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def build_context(docs: List[Document], max_tokens: int = 3000) -> str:
+    """
+    Formats retrieved passages as a compact, token-budgeted context for the LLM.
+
+    Passages are kept in relevance order (by relevance_score when the retriever provides one, retriever order
+    otherwise). Overlapping chunks of the same source are merged into one span and near-duplicate passages are
+    collapsed before they are written as "[n] (source) text". Once the budget is reached the passage that
+    does not fit is truncated (if enough of it remains) and the lower-ranked ones are dropped.
+
+    Args:
+        docs (list[Document]): The retrieved documents, best first.
+        max_tokens (int): The token budget of the whole context (local cl100k_base tokenizer).
+
+    Returns:
+        str: The context.
+    """
+    if all("relevance_score" in doc.metadata for doc in docs):
+        docs = sorted(docs, key=lambda doc: doc.metadata["relevance_score"], reverse=True)
+    docs = collapse_near_duplicates(merge_overlapping_chunks(docs))
+
+    passages, seen, remaining = [], set(), max_tokens
+    for doc in docs:
+        text = compact_text(doc.page_content)
+        if not text or text in seen:
+            continue
+        seen.add(text)
+
+        header = f"[{len(passages) + 1}] ({get_source_tag(doc)}) "
+        available = remaining - count_tokens(header)
+        tokens = count_tokens(text)
+        if tokens > available:
+            if available < MIN_PASSAGE_TOKENS:
+                break
+            text, tokens = truncate_to_tokens(text, available - 1) + " ...", available
+
+        passages.append(header + text)
+        remaining -= count_tokens(header) + tokens
+        if remaining < MIN_PASSAGE_TOKENS:
+            break
+
+    return "\n\n".join(passages) if passages else "No relevant documents found."
@@ -1,8 +1,18 @@
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from utils import get_parent_dir, save_pickle
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from utils import get_parent_dir, hash_file
 import os
-import pickle
-from utils import data_file_exists
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Columns of the corpus cache (one row per data file)
+CORPUS_CACHE_SCHEMA = pa.schema([
+    ("path", pa.string()),          # path relative to the dataset folder
+    ("size", pa.int64()),
+    ("mtime_ns", pa.int64()),
+    ("sha256", pa.string()),
+    ("page_content", pa.large_string()),
+])
 
 class DataLoader():
     def __init__(self, dataset_name:str, data_folder :str = "data"):
@@ -12,48 +22,113 @@ class DataLoader():
         NOTE: The data folder is expected to be one level above the data_loader.py file.
         The data folder is expected to contain a subfolder with the name of the dataset.
         The subfolders there are expected to contain the data files.
-        In the dataset folder, the data once loaded for a first time is saved to a pickle file.
-        The next time the data is loaded, the pickle file is used instead of loading the data from the subfolders.
-        This is to avoid loading the data from the subfolders every time the data is loaded.
+        In the dataset folder, the data once loaded for a first time is saved to a Parquet corpus cache
+        holding, per file, its relative path, size, mtime, content hash and text.
+        Every document gets its path relative to the dataset folder as stable ID (metadata["doc_id"]).
+        The next time the data is loaded, only the files whose size, mtime or content changed are re-read,
+        and the changes (added, changed, removed documents) are reported by get_changes().
 
         Args:
             dataset_name (str): The name of the dataset (this will also be the name of the subfolder in the data folder,
-             and the pickle file).
+             and the corpus cache file).
             data_folder (str): The name of the data folder.
-        
+
         '''
         self.data_folder = data_folder
         self.dataset_name = dataset_name
         self.data_path = None
         self.loaded_data = None
-        
+        self.changes = {"added": [], "changed": [], "removed": []}
+
 
     def load_data(self):
         '''
-        Loads data from the data folder and saves it to a pickle file if it doesn't exist.
+        Loads data from the data folder, reusing the corpus cache for the files that did not change,
+        and refreshes the cache if anything changed.
         '''
 
         base_path = get_parent_dir(__file__)
         self.data_path = os.path.join(base_path, self.data_folder, self.dataset_name)
+        cache_path = os.path.join(self.data_path, f"{self.dataset_name}.parquet")
 
-        exists = data_file_exists(self.data_path, self.dataset_name)
+        cached = self._read_cache(cache_path)
+        dirty = not cached
+        rows = []
+        changes = {"added": [], "changed": [], "removed": []}
 
-        if exists:
-            with open(os.path.join(self.data_path, f"{self.ataset_name}.pkl"), "rb") as f:
-                loaded_data = pickle.load(f)
-        else:
-            directory_loader = DirectoryLoader(self.data_path, glob="**/*.txt", loader_cls=TextLoader)
-            loaded_data = directory_loader.load()
-            save_pickle(loaded_data, os.path.join(self.data_path, f"{self.dataset_name}.pkl"))
+        for rel_path in self._list_data_files():
+            full_path = os.path.join(self.data_path, rel_path)
+            stat = os.stat(full_path)
+            cached_row = cached.pop(rel_path, None)
 
-        return loaded_data
-    
-    def get_loaded_data(self):
-        return self.loaded_data
+            if cached_row and cached_row["size"] == stat.st_size and cached_row["mtime_ns"] == stat.st_mtime_ns:
+                rows.append(cached_row)
+                continue
+
+            dirty = True
+            sha256 = hash_file(full_path)
+            if cached_row and cached_row["sha256"] == sha256:
+                # touched but not modified: keep the cached text, refresh the stat fields
+                page_content = cached_row["page_content"]
+            else:
+                page_content = TextLoader(full_path).load()[0].page_content
+                changes["changed" if cached_row else "added"].append(rel_path)
+
+            rows.append({
+                "path": rel_path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                "page_content": page_content,
+            })
+
+        # whatever is left in the cache no longer exists on disk
+        changes["removed"] = sorted(cached)
 
+        if dirty or changes["removed"]:
+            self._write_cache(cache_path, rows)
 
+        self.changes = changes
+        self.loaded_data = [
+            Document(
+                page_content=row["page_content"],
+                metadata={"source": os.path.join(self.data_path, row["path"]), "doc_id": row["path"]}
+            )
+            for row in rows
+        ]
 
+        return self.loaded_data
+
+    def get_loaded_data(self):
+        return self.loaded_data
+
+    def get_changes(self):
+        '''
+        Returns the doc_ids (see load_data) added, changed and removed since the corpus cache was last written.
+        The added and changed documents go to VectorStoresManager.upsert_documents, the removed ones to
+        delete_documents.
+        '''
+        return self.changes
 
+    def _list_data_files(self):
+        rel_paths = []
+        for root, _, files in os.walk(self.data_path):
+            for file in files:
+                if file.endswith(".txt"):
+                    rel_paths.append(os.path.relpath(os.path.join(root, file), self.data_path))
+        return sorted(rel_paths)
 
+    def _read_cache(self, cache_path):
+        if not os.path.isfile(cache_path):
+            return {}
+        try:
+            table = pq.read_table(cache_path, schema=CORPUS_CACHE_SCHEMA)
+        except (pa.ArrowInvalid, OSError):
+            return {}  # unreadable cache: reload everything
+        return {row["path"]: row for row in table.to_pylist()}
 
-    
\ No newline at end of file
+    def _write_cache(self, cache_path, rows):
+        table = pa.Table.from_pylist(rows, schema=CORPUS_CACHE_SCHEMA)
+        tmp_path = cache_path + ".tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cache_path)
@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Shared pool running the ensemble branches; branches that miss their deadline keep running here
+# until they finish, but their results are discarded (see ConcurrentEnsembleRetriever.max_abandoned_per_branch)
+_branch_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ensemble-branch")
+
+
+def weighted_reciprocal_rank_fusion(ranked_lists: Dict[str, List[Document]], weights: Dict[str, float],
+                                    c: int = 60, id_key: Optional[str] = None) -> List[Document]:
+    """
+    Fuses ranked document lists with weighted reciprocal rank fusion: score(d) = sum_i w_i / (c + rank_i(d)).
+
+    Args:
+        ranked_lists (dict): Branch name -> ranked documents.
+        weights (dict): Branch name -> weight (1.0 for branches missing from it).
+        c (int): The RRF constant (higher values flatten the contribution of the top ranks).
+        id_key (str): Metadata key identifying a document; the page content is used when None.
+
+    Returns:
+        list[Document]: The deduplicated documents, best fused score first.
+    """
+    scores, documents = {}, {}
+    for name, docs in ranked_lists.items():
+        for rank, doc in enumerate(docs, start=1):
+            key = doc.metadata.get(id_key) if id_key else doc.page_content
+            scores[key] = scores.get(key, 0.0) + weights.get(name, 1.0) / (c + rank)
+            documents.setdefault(key, doc)
+
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class ConcurrentEnsembleRetriever(BaseRetriever):
+    """
+    Ensemble retriever running its branches concurrently under a per-request deadline.
+
+    Each branch also has its own timeout (defaulting to the deadline). Whatever arrived in time is fused with
+    weighted reciprocal rank fusion; branches that timed out or failed are dropped and reported, so the ensemble
+    latency is roughly that of the slowest branch that made it, capped by the deadline.
+
+    A call that missed its cutoff keeps its pool thread until it returns. Once a branch has
+    max_abandoned_per_branch such calls still running (a slow upstream), it is skipped by new requests
+    until they finish, so one slow branch cannot take over the shared pool.
+    """
+
+    retrievers: Dict[str, BaseRetriever]
+    weights: Dict[str, float]
+    deadline_seconds: float = 5.0
+    branch_timeouts: Dict[str, float] = {}
+    c: int = 60
+    id_key: Optional[str] = None
+    max_abandoned_per_branch: int = 2
+
+    _abandoned: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _abandoned_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _branch_saturated(self, name: str) -> bool:
+        with self._abandoned_lock:
+            return self._abandoned.get(name, 0) >= self.max_abandoned_per_branch
+
+    def _abandon(self, name: str, future):
+        # counted until the call returns (immediately if it was cancelled before starting)
+        with self._abandoned_lock:
+            self._abandoned[name] = self._abandoned.get(name, 0) + 1
+        future.add_done_callback(lambda _: self._release_abandoned(name))
+
+    def _release_abandoned(self, name: str):
+        with self._abandoned_lock:
+            self._abandoned[name] -= 1
+
+    def get_relevant_documents_with_report(self, query: str):
+        """
+        Returns (fused documents, report), the report giving the per-branch status and the dropped branches.
+        """
+        start = time.monotonic()
+        ranked_lists, report = {}, {"branches": {}, "dropped": []}
+
+        futures = {}
+        for name, retriever in self.retrievers.items():
+            if self._branch_saturated(name):
+                report["branches"][name] = "skipped: earlier calls still running"
+                report["dropped"].append(name)
+                continue
+            # each branch runs in a copy of the caller's context (tracing / callback parent run)
+            futures[name] = _branch_executor.submit(copy_context().run, retriever.invoke, query)
+
+        # wait for the branches in order of their cutoff, so each one gets exactly its own budget
+        cutoffs = {
+            name: start + min(self.branch_timeouts.get(name, self.deadline_seconds), self.deadline_seconds)
+            for name in futures
+        }
+
+        for name in sorted(futures, key=cutoffs.get):
+            try:
+                ranked_lists[name] = futures[name].result(timeout=max(cutoffs[name] - time.monotonic(), 0.0))
+                report["branches"][name] = "ok"
+            except FutureTimeoutError:
+                futures[name].cancel()
+                self._abandon(name, futures[name])
+                report["branches"][name] = "timeout"
+                report["dropped"].append(name)
+            except Exception as e:
+                report["branches"][name] = f"error: {e}"
+                report["dropped"].append(name)
+
+        report["elapsed_seconds"] = time.monotonic() - start
+        docs = weighted_reciprocal_rank_fusion(ranked_lists, self.weights, c=self.c, id_key=self.id_key)
+        return docs, report
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs, report = self.get_relevant_documents_with_report(query)
+        if report["dropped"]:
+            logger.warning("Ensemble branches dropped: %s", {name: report["branches"][name] for name in report["dropped"]})
+        return docs
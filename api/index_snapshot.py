@@ -0,0 +1,272 @@
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bm25 import BM25Index, SparseBM25Retriever
+from compact_docstore import CompactDocStore
+from utils import get_parent_dir
+
+SNAPSHOT_FORMAT_VERSION = 5
+LATEST_POINTER = "LATEST"
+
+# Collections of VectorStoresManager persisted in every snapshot
+BASE_COLLECTION = "base"
+PARENT_DOCUMENT_COLLECTION = "full_documents"
+
+
+def get_default_snapshot_root() -> str:
+    """
+    Returns the default folder holding the versioned index snapshots (data/index_snapshots).
+    """
+    return os.path.join(get_parent_dir(__file__), "data", "index_snapshots")
+
+
+def resolve_snapshot_dir(snapshot_root: str = None):
+    """
+    Resolves the snapshot directory the API should serve from.
+
+    The INDEX_SNAPSHOT_DIR environment variable pins an exact snapshot (recommended when running several
+    workers, so all of them load exactly the same index). Otherwise the snapshot referenced by the LATEST
+    pointer file of the snapshot root is used.
+
+    Args:
+        snapshot_root (str): The folder holding the versioned snapshots.
+
+    Returns:
+        str | None: The snapshot directory, or None if no snapshot has been built yet.
+    """
+    pinned = os.getenv("INDEX_SNAPSHOT_DIR")
+    if pinned:
+        return pinned
+
+    snapshot_root = snapshot_root or get_default_snapshot_root()
+    pointer_path = os.path.join(snapshot_root, LATEST_POINTER)
+    if not os.path.isfile(pointer_path):
+        return None
+
+    with open(pointer_path, "r", encoding="utf-8") as f:
+        version = f.read().strip()
+
+    snapshot_dir = os.path.join(snapshot_root, version)
+    return snapshot_dir if os.path.isfile(os.path.join(snapshot_dir, "manifest.json")) else None
+
+
+# ===============================
+# Writing snapshots
+# ===============================
+
+def _export_collection(client, collection_name: str, batch_size: int = 512):
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        for point in points:
+            ids.append(str(point.id))
+            vectors.append(point.vector)
+            payloads.append(point.payload)
+        if offset is None:
+            break
+    return ids, np.asarray(vectors, dtype=np.float32), payloads
+
+
+def _export_vectorstore(vectorstore):
+    # NumPy backend: arrays are exported directly; Qdrant backends: points are scrolled out of the collection
+    if hasattr(vectorstore, "export_points"):
+        return vectorstore.export_points()
+    return _export_collection(vectorstore.client, vectorstore.collection_name)
+
+
+def _write_collection(snapshot_dir: str, name: str, ids, vectors, payloads):
+    np.save(os.path.join(snapshot_dir, f"{name}.vectors.npy"), vectors)
+    with open(os.path.join(snapshot_dir, f"{name}.payloads.jsonl"), "w", encoding="utf-8") as f:
+        for point_id, payload in zip(ids, payloads):
+            f.write(json.dumps({"id": point_id, "payload": payload}) + "\n")
+
+
+def save_index_snapshot(dbs_manager, bm25_retriever: SparseBM25Retriever, snapshot_root: str = None) -> str:
+    """
+    Writes every retrieval artifact of a populated VectorStoresManager into a new versioned snapshot directory
+    and points LATEST at it.
+
+    Layout:
+        manifest.json                       format version, build settings and collection sizes
+        base.vectors.npy / .payloads.jsonl  base Qdrant collection (float32 vectors, point ids + payloads)
+        full_documents.vectors.npy / ...    parent document child collection
+        docstore.bin / .offsets.npy / ...   compact parent docstore (see compact_docstore.CompactDocStore.save)
+        bm25/                               BM25 sparse index (see bm25.BM25Index.save)
+
+    Args:
+        dbs_manager (VectorStoresManager): The manager, with its parent docstore already populated.
+        bm25_retriever (SparseBM25Retriever): The BM25 retriever to persist.
+        snapshot_root (str): The folder holding the versioned snapshots.
+
+    Returns:
+        str: The new snapshot directory.
+    """
+    snapshot_root = snapshot_root or get_default_snapshot_root()
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%SZ")
+    snapshot_dir = os.path.join(snapshot_root, version)
+    os.makedirs(snapshot_dir, exist_ok=False)
+
+    collections = {
+        BASE_COLLECTION: dbs_manager.get_base_vectorstore(),
+        PARENT_DOCUMENT_COLLECTION: dbs_manager.get_parent_document_vectorstore()
+    }
+
+    sizes = {}
+    for name, vectorstore in collections.items():
+        ids, vectors, payloads = _export_vectorstore(vectorstore)
+        _write_collection(snapshot_dir, name, ids, vectors, payloads)
+        sizes[name] = {"points": len(ids), "dim": int(vectors.shape[1]) if len(ids) else 0}
+
+    dbs_manager.get_in_memory_store().save(snapshot_dir)
+
+    bm25_retriever.index.save(os.path.join(snapshot_dir, "bm25"))
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "MODE": dbs_manager.MODE,
+        "embeddings_model_name": dbs_manager.embeddings_model_name,
+        "chunk_config": dbs_manager.chunk_config,
+        "collections": sizes
+    }
+    with open(os.path.join(snapshot_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the LATEST pointer atomically so readers never see a partially written snapshot
+    pointer_tmp = os.path.join(snapshot_root, f".{LATEST_POINTER}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(snapshot_root, LATEST_POINTER))
+
+    return snapshot_dir
+
+
+# ===============================
+# Reading snapshots
+# ===============================
+
+def _read_collection(snapshot_dir: str, name: str, texts: dict):
+    # Vectors are memory-mapped read-only: pages are loaded lazily and shared between worker processes
+    vectors = np.load(os.path.join(snapshot_dir, f"{name}.vectors.npy"), mmap_mode="r")
+    ids, payloads = [], []
+    with open(os.path.join(snapshot_dir, f"{name}.payloads.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            payload = record["payload"]
+            payload["page_content"] = texts.setdefault(payload["page_content"], payload["page_content"])
+            ids.append(record["id"])
+            payloads.append(payload)
+    return ids, vectors, payloads
+
+
+def load_index_snapshot(snapshot_dir: str) -> dict:
+    """
+    Opens a snapshot written by save_index_snapshot.
+
+    The chunk texts are read once per process: a text found in several artifacts (e.g. a base chunk and the
+    same BM25 document) is one shared string, and the parent documents stay in the memory-mapped docstore.
+
+    Args:
+        snapshot_dir (str): The snapshot directory.
+
+    Returns:
+        dict: manifest, collections ({name: (ids, vectors, payloads)}), docstore (memory-mapped CompactDocStore)
+        and bm25_retriever.
+    """
+    with open(os.path.join(snapshot_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+
+    texts = {}
+    collections = {
+        name: _read_collection(snapshot_dir, name, texts)
+        for name in (BASE_COLLECTION, PARENT_DOCUMENT_COLLECTION)
+    }
+
+    docstore = CompactDocStore.load(snapshot_dir)
+
+    bm25_retriever = SparseBM25Retriever(index=BM25Index.load(os.path.join(snapshot_dir, "bm25"), texts=texts))
+
+    return {
+        "snapshot_dir": snapshot_dir,
+        "manifest": manifest,
+        "collections": collections,
+        "docstore": docstore,
+        "bm25_retriever": bm25_retriever
+    }
+
+
+# ===============================
+# Offline build entry point
+# ===============================
+
+def build_index_snapshot(dataset_name: str = "pd_blogs_filtered",
+                         chunk_size: int = 1000,
+                         chunk_overlap: int = 200,
+                         embeddings_model_name: str = "text-embedding-3-small",
+                         snapshot_root: str = None) -> str:
+    """
+    Loads the corpus, embeds it, populates the parent docstore and BM25 index, and saves everything as a snapshot.
+    The defaults mirror the configuration served by LangGraphAgent.
+    """
+    from dotenv import load_dotenv
+    from langchain.retrievers import ParentDocumentRetriever
+    from data_loader import DataLoader
+    from retrievers import get_document_ids
+    from vector_stores import VectorStoresManager
+
+    load_dotenv()
+
+    loaded_data = DataLoader(dataset_name).load_data()
+
+    dbs_manager = VectorStoresManager(
+        MODE="baseline",
+        loaded_data=loaded_data,
+        chunk_config={"enabled": True, "params": {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}},
+        embeddings_model_name=embeddings_model_name
+    )
+
+    parent_document_retriever = ParentDocumentRetriever(
+        vectorstore=dbs_manager.get_parent_document_vectorstore(),
+        docstore=dbs_manager.get_in_memory_store(),
+        child_splitter=dbs_manager.get_child_splitter(),
+    )
+    dbs_manager.ingest_child_embeddings()
+    parent_document_retriever.add_documents(loaded_data, ids=get_document_ids(loaded_data))
+
+    bm25_retriever = SparseBM25Retriever.from_documents(dbs_manager.get_chunked_loaded_data())
+
+    return save_index_snapshot(dbs_manager, bm25_retriever, snapshot_root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a versioned retrieval index snapshot for the API.")
+    parser.add_argument("--dataset", default="pd_blogs_filtered")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--embeddings-model", default="text-embedding-3-small")
+    parser.add_argument("--snapshot-root", default=None)
+    args = parser.parse_args()
+
+    snapshot_dir = build_index_snapshot(
+        dataset_name=args.dataset,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embeddings_model_name=args.embeddings_model,
+        snapshot_root=args.snapshot_root
+    )
+    print(f"Index snapshot written to {snapshot_dir}")
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+from utils import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Checkpoints of at most this many corpora (the most recently updated ones) are kept
+MAX_CHECKPOINT_RUNS = 16
+
+
+def _get_status_code(error: Exception):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    True for provider rate-limit responses (HTTP 429), whatever the client library raising them.
+    """
+    return _get_status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    True for transient failures: rate limits, request timeouts (408), server errors (5xx) and network errors
+    or timeouts. Other failures (e.g. 400/401/403: a bad request or API key) are permanent.
+    """
+    if is_rate_limit_error(error):
+        return True
+    status = _get_status_code(error)
+    if isinstance(status, int):
+        return status == 408 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # client library network errors, e.g. openai.APIConnectionError / APITimeoutError, httpx.TransportError
+    return any(marker in type(error).__name__ for marker in ("Connection", "Timeout", "Transport"))
+
+
+class _AdaptiveLimit():
+    def __init__(self, max_concurrency: int):
+        # AIMD concurrency limit: halved on rate limits, increased by one after each success
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def release(self, rate_limited: bool = False):
+        with self._condition:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1)
+            self._condition.notify_all()
+
+
+class EmbeddingIngestionPipeline():
+    def __init__(self, embeddings, checkpoint_path: str, max_batch_tokens: int = 20000, max_batch_size: int = 512,
+                 max_concurrency: int = 4, max_retries: int = 8, base_backoff_seconds: float = 1.0,
+                 max_backoff_seconds: float = 60.0, progress_callback: Optional[Callable[[dict], None]] = None):
+        '''
+        Resumable, rate-limit-aware batched embedding of a corpus.
+
+        Texts are grouped into batches of at most max_batch_tokens tokens (and max_batch_size texts) and
+        embedded with up to max_concurrency concurrent requests. Rate-limit responses halve the concurrency
+        and are retried with exponential backoff and jitter; other transient errors (5xx, network errors and
+        timeouts) are retried with backoff, and permanent ones (e.g. a bad API key) are raised at once.
+
+        Embeddings go through the given (disk-cached, see vector_stores.get_cached_embeddings_model) model,
+        so every finished batch is durable. A checkpoint file records, per corpus, how many leading batches are
+        finished (a high-water mark): a restarted build skips them and their vectors are read back from the
+        embedding cache when the vector stores are built.
+
+        Args:
+            embeddings: The embeddings model (its embed_documents persists the vectors).
+            checkpoint_path (str): The JSON checkpoint file.
+            max_batch_tokens (int): The maximum number of tokens per embeddings request.
+            max_batch_size (int): The maximum number of texts per embeddings request.
+            max_concurrency (int): The maximum number of concurrent embeddings requests.
+            max_retries (int): The number of retries of a transient failure before giving up.
+            base_backoff_seconds (float): The first retry delay (doubled on every retry).
+            max_backoff_seconds (float): The maximum retry delay.
+            progress_callback (Callable): Called with the progress dict after every batch.
+        '''
+        self.embeddings = embeddings
+        self.checkpoint_path = checkpoint_path
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.progress_callback = progress_callback
+        self._lock = threading.Lock()
+
+    def make_batches(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _batch_key(batch: List[str]) -> str:
+        digest = hashlib.sha256()
+        for text in batch:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _run_key(batch_keys: List[str]) -> str:
+        # identifies the corpus and its batching: a high-water mark only applies to the same batches
+        digest = hashlib.sha256()
+        for key in batch_keys:
+            digest.update(bytes.fromhex(key))
+        return digest.hexdigest()
+
+    def _load_checkpoint(self) -> dict:
+        # run key -> {"completed_batches": high-water mark, "batches", "updated_at"}
+        if not os.path.isfile(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                runs = json.load(f).get("runs", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+        return runs if isinstance(runs, dict) else {}
+
+    def _save_checkpoint(self, runs: dict):
+        runs = dict(sorted(runs.items(), key=lambda item: item[1].get("updated_at", 0.0))[-MAX_CHECKPOINT_RUNS:])
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"runs": runs}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _embed_batch(self, batch: List[str], limit: _AdaptiveLimit):
+        for attempt in range(self.max_retries + 1):
+            limit.acquire()
+            rate_limited = False
+            try:
+                self.embeddings.embed_documents(batch)
+                return
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = min(self.max_backoff_seconds, self.base_backoff_seconds * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.5)
+                logger.warning("Embedding batch failed (%s), retry %d/%d in %.1fs",
+                               "rate limited" if rate_limited else type(e).__name__, attempt + 1, self.max_retries, delay)
+            finally:
+                limit.release(rate_limited=rate_limited)
+            time.sleep(delay)
+
+    def run(self, texts: List[str]) -> dict:
+        """
+        Embeds every text not covered by the checkpoint yet.
+
+        Returns:
+            dict: The progress report (batches, chunks, skipped, elapsed_seconds, chunks_per_second).
+        """
+        start = time.monotonic()
+        batches = self.make_batches(texts)
+        run_key = self._run_key([self._batch_key(batch) for batch in batches])
+        runs = self._load_checkpoint()
+        high_water = min(int(runs.get(run_key, {}).get("completed_batches", 0)), len(batches))
+        # batches finish out of order: those past the high-water mark are tracked until it reaches them
+        finished_ahead = set()
+
+        progress = {
+            "batches": len(batches),
+            "chunks": len(texts),
+            "skipped_batches": high_water,
+            "done_batches": high_water,
+            "embedded_chunks": 0,
+            "elapsed_seconds": 0.0,
+            "chunks_per_second": 0.0,
+        }
+
+        limit = _AdaptiveLimit(self.max_concurrency)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ingestion") as executor:
+            futures = {
+                executor.submit(self._embed_batch, batches[index], limit): index
+                for index in range(high_water, len(batches))
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    # a failed batch aborts the run (the checkpoint keeps the high-water mark): drop the queued ones
+                    for queued in futures:
+                        queued.cancel()
+                    raise
+                index = futures[future]
+                batch = batches[index]
+                with self._lock:
+                    finished_ahead.add(index)
+                    while high_water in finished_ahead:
+                        finished_ahead.remove(high_water)
+                        high_water += 1
+                    runs[run_key] = {"completed_batches": high_water, "batches": len(batches), "updated_at": time.time()}
+                    self._save_checkpoint(runs)
+                    elapsed = time.monotonic() - start
+                    progress["done_batches"] += 1
+                    progress["embedded_chunks"] += len(batch)
+                    progress["elapsed_seconds"] = elapsed
+                    progress["chunks_per_second"] = progress["embedded_chunks"] / elapsed if elapsed else 0.0
+                logger.info("Embedded batch %d/%d (%.1f chunks/s)", progress["done_batches"], progress["batches"],
+                            progress["chunks_per_second"])
+                if self.progress_callback:
+                    self.progress_callback(dict(progress))
+
+        progress["elapsed_seconds"] = time.monotonic() - start
+        return progress
@@ -1,10 +1,16 @@
 import os
+import time
 from typing import List, Dict, Any
 from fastapi import UploadFile, HTTPException
 from uuid import uuid4
+from functools import partial
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain_core.tools import tool
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.documents import Document
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
@@ -17,6 +23,17 @@ from tools import tavily_tool, custom_rag_tool
 from retrievers import get_retrieval_chains_and_wrappers
 from vector_stores import VectorStoresManager
 from data_loader import DataLoader
+from answer_cache import SemanticAnswerCache
+from session_store import SessionStore, DEFAULT_SESSION_ID
+from index_snapshot import resolve_snapshot_dir, load_index_snapshot
+from startup import StartupTracker
+from memory_compaction import ConversationCompactor
+from utils import truncate_to_tokens
+from metrics import (NODE_LATENCY, RETRIEVAL_LATENCY, REQUEST_LATENCY, REACT_ITERATIONS, TOOL_CALLS_PER_REQUEST,
+                     TOOL_CALLS, LLM_TOKENS, track_upstream)
+
+# Answers are stored in the session memory up to this many tokens
+MEMORY_ANSWER_MAX_TOKENS = 600
 
 class RetrievalEnums(Enum):
     NAIVE = "base_retrieval_chain"
@@ -42,12 +59,20 @@ class AgentState(TypedDict):
 # ----------------------------------------
 
 class LangGraphAgent():
-    def __init__(self, retriever_mode: RetrievalEnums, MODE: str, langchain_project_name: str):
+    def __init__(self, retriever_mode: RetrievalEnums, MODE: str, langchain_project_name: str,
+                 answer_cache_config = {"enabled": False, "params": {"threshold": 0.92, "max_entries": 500, "ttl_seconds": 3600}},
+                 startup_tracker: StartupTracker = None):
 
         self.agent_graph = None
         self.react_model = None
         self.tool_belt = None
-        self.agent_memory = []
+        self.sessions = SessionStore()
+        self.compactor = None
+        # Bounded pool for the purely synchronous work done by the tool nodes (e.g. retrieval)
+        self.tool_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AGENT_TOOL_THREADS", "8")),
+            thread_name_prefix="agent-tools"
+        )
         self.count = 0
 
         self.retrievers_config = None
@@ -60,6 +85,10 @@ class LangGraphAgent():
         self.MODE = MODE
         self.loaded_rag_data = None
         self.dbs_manager = None
+        self.answer_cache_config = answer_cache_config
+        self.answer_cache = None
+        # Initialization phases and timings (reported by /api/ready)
+        self.startup = startup_tracker or StartupTracker()
 
         # Automatically loads variables from .env file into os.environ
         load_dotenv()
@@ -75,20 +104,20 @@ class LangGraphAgent():
         self._initialization()
 
 
-    def _call_model(self, state: AgentState):
+    async def _call_model(self, state: AgentState):
         """Generate reasoning output using context + prior messages"""
 
         agent_memory = state.get("agent_memory", [])
         current = state.get("current_messages", [])
 
-        # Combine messages: last 3 from agent_memory + current messages
-        if len(agent_memory) >= 3:
-            messages =  current + agent_memory[-3:]
-        else:
-            messages =  current + agent_memory
+        # Stable prefix first (system prompt, conversation summary, recent complete exchanges), then the
+        # current exchange: successive calls share the longest possible prefix (provider prompt caching)
+        messages = agent_memory + current
 
         if self.react_model:
-            response = self.react_model.invoke(messages)
+            with NODE_LATENCY.time(node="agent"), track_upstream("openai", "chat"):
+                response = await self.react_model.ainvoke(messages)
+            self._record_model_usage(response)
             return {
                 **state,  # propagate all values, including agent_memory
                 "current_messages": [response],
@@ -99,6 +128,25 @@ class LangGraphAgent():
             raise HTTPException(status_code=500, detail="Model not initialized")
 
 
+    @staticmethod
+    def _record_model_usage(response):
+        usage = getattr(response, "usage_metadata", None) or {}
+        model = (getattr(response, "response_metadata", None) or {}).get("model_name", "unknown")
+        for token_type in ("input_tokens", "output_tokens"):
+            if usage.get(token_type):
+                LLM_TOKENS.inc(usage[token_type], model=model, type=token_type.replace("_tokens", ""))
+        for call in getattr(response, "tool_calls", None) or []:
+            TOOL_CALLS.inc(tool=call["name"])
+
+    @staticmethod
+    def _record_request(endpoint: str, start: float, messages, answer_cache_hit: bool = False):
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, answer_cache_hit=str(answer_cache_hit).lower())
+        if answer_cache_hit:
+            return
+        agent_messages = [msg for msg in messages if isinstance(msg, AIMessage)]
+        REACT_ITERATIONS.observe(len(agent_messages))
+        TOOL_CALLS_PER_REQUEST.observe(sum(len(getattr(msg, "tool_calls", None) or []) for msg in agent_messages))
+
     def _should_continue(self, state: AgentState):
         current = state.get("current_messages", [])
         last_message = current[-1] if current else None
@@ -114,13 +162,17 @@ class LangGraphAgent():
     def _initialization(self):
         """Initialize models, graph, and dependencies"""
         try:
+            self.startup.begin("models")
 
             # set up tool belt
             self.tool_belt = [tavily_tool, custom_rag_tool]
 
             # set up model
-            self.react_model = ChatOpenAI(model="gpt-4.1-mini", temperature=0.7).bind_tools(self.tool_belt)
-            self.rag_model = ChatOpenAI(model="gpt-4.1-mini", temperature=0.7)
+            # stream_usage: streamed calls (/api/chat/stream) report their token usage too
+            self.react_model = ChatOpenAI(model="gpt-4.1-mini", temperature=0.7, stream_usage=True).bind_tools(self.tool_belt)
+            self.rag_model = ChatOpenAI(model="gpt-4.1-mini", temperature=0.7, stream_usage=True)
+            # older turns are folded into a running summary in the background (see memory_compaction.py)
+            self.compactor = ConversationCompactor(ChatOpenAI(model="gpt-4.1-mini", temperature=0))
 
             graph = StateGraph(AgentState, name="companion-agent-graph")
 
@@ -135,58 +187,93 @@ class LangGraphAgent():
 
             self.agent_graph = graph.compile()
 
-            # set up retrievers
-            data_loader = DataLoader("pd_blogs_filtered")
-            self.loaded_rag_data = data_loader.load_data()
-
-            TEST = "First Improved"
-
-            if TEST == "First Naive":
-                self.dbs_manager = VectorStoresManager(    
-                    MODE="baseline",
-                    loaded_data=self.loaded_rag_data,
-                    chunk_config={"enabled": True, "params": {"chunk_size": 750, "chunk_overlap": 0}},
-                    embeddings_model_name="text-embedding-3-small",
-                    chat_model="gpt-4.1-mini",
-                    collection_name="Rag Loaded Data Naive"
-                 )
+            self.startup.begin("index")
+
+            # set up retrievers: serve from a prebuilt index snapshot when available (see index_snapshot.py)
+            snapshot_dir = resolve_snapshot_dir()
+            bm25_retriever = None
+            # vector backend: in-memory Qdrant (default) or the in-process NumPy index (see numpy_vector_store.py)
+            vector_backend = os.getenv("VECTOR_BACKEND", "qdrant")
+            vector_dtype = os.getenv("VECTOR_DTYPE", "float32")
+
+            if snapshot_dir:
+                snapshot = load_index_snapshot(snapshot_dir)
+                self.dbs_manager = VectorStoresManager.from_snapshot(snapshot, vector_backend=vector_backend, vector_dtype=vector_dtype)
+                self.loaded_rag_data = self.dbs_manager.get_loaded_data()
+                bm25_retriever = snapshot["bm25_retriever"]
             else:
-                self.dbs_manager = VectorStoresManager(    
-                    MODE="baseline",
-                    loaded_data=self.loaded_rag_data,
-                    chunk_config={"enabled": True, "params": {"chunk_size": 1000, "chunk_overlap": 200}},
-                    embeddings_model_name="text-embedding-3-small",
-                    chat_model="gpt-4.1-mini",
-                    collection_name="Rag Loaded Data Improved"
-                )
+                data_loader = DataLoader("pd_blogs_filtered")
+                self.loaded_rag_data = data_loader.load_data()
+
+                TEST = "First Improved"
+
+                if TEST == "First Naive":
+                    self.dbs_manager = VectorStoresManager(    
+                        MODE="baseline",
+                        loaded_data=self.loaded_rag_data,
+                        chunk_config={"enabled": True, "params": {"chunk_size": 750, "chunk_overlap": 0}},
+                        embeddings_model_name="text-embedding-3-small",
+                        chat_model="gpt-4.1-mini",
+                        collection_name="Rag Loaded Data Naive",
+                        vector_backend=vector_backend,
+                        vector_dtype=vector_dtype
+                     )
+                else:
+                    self.dbs_manager = VectorStoresManager(    
+                        MODE="baseline",
+                        loaded_data=self.loaded_rag_data,
+                        chunk_config={"enabled": True, "params": {"chunk_size": 1000, "chunk_overlap": 200}},
+                        embeddings_model_name="text-embedding-3-small",
+                        chat_model="gpt-4.1-mini",
+                        collection_name="Rag Loaded Data Improved",
+                        vector_backend=vector_backend,
+                        vector_dtype=vector_dtype
+                    )
+
+            self.startup.begin("retrievers")
 
             self.retrievers_config = {
                 "base": {
-                    "vectorstore": self.dbs_manager.get_base_vectorstore()
+                    "get_vectorstore": self.dbs_manager.get_base_vectorstore  # built on first use only
                 },
                 "parent_document": {
                     "vectorstore": self.dbs_manager.get_parent_document_vectorstore(),
                     "in_memory_store": self.dbs_manager.get_in_memory_store(),
-                    "child_splitter": self.dbs_manager.get_child_splitter()
+                    "child_splitter": self.dbs_manager.get_child_splitter(),
+                    "prepopulated": snapshot_dir is not None,
+                    "ingest_embeddings": self.dbs_manager.ingest_child_embeddings
+                },
+                "bm25": {
+                    "retriever": bm25_retriever,
+                    "documents": self.dbs_manager.get_chunked_loaded_data()
                 }
             }
 
             # set up retrievers
+            # only the served mode is built; build it now so the first request does not pay for it
             self.retrival_chains, self.retrival_wrappers = get_retrieval_chains_and_wrappers(
                 self.retrievers_config, 
                 self.loaded_rag_data,
                 self.rag_model,
-                self.MODE)
+                self.MODE,
+                modes=[self.retriever_mode.value])
+            self.retrival_chains[self.retriever_mode.value]
+
+            # set up the (optional) semantic answer cache
+            self.startup.begin("answer_cache")
+            if self.answer_cache_config["enabled"]:
+                self.answer_cache = SemanticAnswerCache(self.dbs_manager.embeddings_model, **self.answer_cache_config["params"])
 
         except Exception as e:
             print(f"Error in initialization: {str(e)}") 
             raise HTTPException(status_code=500, detail=f"Failed to initialize Agent and dependencies: {str(e)}")
 
-    def _search_node(self, state: AgentState):
+    async def _search_node(self, state: AgentState):
         """Search the web for the latest information related to query"""
 
         query = state.get("query", "")
-        search_result = tavily_tool.invoke(query)
+        with NODE_LATENCY.time(node="search"):
+            search_result = await tavily_tool.ainvoke(query)
 
         updated_context = state.get("context", {}).copy()
         updated_context.setdefault("search", []).append(search_result)
@@ -211,17 +298,23 @@ class LangGraphAgent():
             "context": updated_context
         }
 
-    def _rag_node(self, state: AgentState):
+    async def _rag_node(self, state: AgentState):
         """Custom RAG-based search for relevant info."""
 
         query = state.get("query", "")
 
-        rag_result = custom_rag_tool.invoke(
-            {"input" : {
-                "query": query,
-                "retriever": self.retrival_wrappers[self.retriever_mode.value]
-            }}
-        )
+        # Retrieval (Qdrant, Cohere rerank, MultiQuery) is synchronous: run it on the bounded tool pool
+        # so it does not stall the event loop. An explicit executor does not carry the context variables
+        # over, so the call runs in a copy of the current context (tracing / callback parent run)
+        with NODE_LATENCY.time(node="rag"), RETRIEVAL_LATENCY.time(mode=self.retriever_mode.value):
+            rag_result = await run_in_executor(
+                self.tool_executor,
+                partial(copy_context().run, custom_rag_tool.invoke),
+                {"input" : {
+                    "query": query,
+                    "retriever": self.retrival_wrappers[self.retriever_mode.value]
+                }}
+            )
 
         updated_context = state.get("context", {}).copy()
         updated_context.setdefault("rag", []).append(rag_result)
@@ -246,21 +339,75 @@ class LangGraphAgent():
             "context": updated_context
         }
     
-    async def chat(self, user_message: str):
+    def _build_inputs(self, user_message: str, session_memory) -> AgentState:
+        """Build the graph input state for a user message"""
+
+        force_message = "Use your RAG tool or web search tool to get context to asnwer my question"
+        sys_msg = SystemMessage(content=SYSTEM_PROMPT)
+        user_msg =  HumanMessage(content=user_message + " " + force_message)
+
+        return {
+            "query": user_message,
+            "current_messages": [user_msg],
+            # prompt prefix: system prompt, then the session summary and recent exchanges
+            "agent_memory": [sys_msg] + session_memory.get_messages(),
+            "context": {},
+            "response": ""
+        }
+
+    def _remember_turn(self, session_memory, user_message: str, answer: str):
+        """Store the exchange as one complete turn (question + answer) and compact the session if due"""
+        if not answer:
+            return
+        session_memory.add_turn([
+            HumanMessage(content=user_message),
+            AIMessage(content=truncate_to_tokens(answer, MEMORY_ANSWER_MAX_TOKENS))
+        ])
+        if self.compactor:
+            self.compactor.schedule(session_memory)
+
+    async def _lookup_answer_cache(self, user_message: str, session_memory):
+        """Return (query embedding, cache generation, cached reply or None); (None, None, None) when the answer cache is not used"""
+        # The cache is shared by all sessions and keyed on the message alone: it only serves (and stores)
+        # the first message of a conversation, whose answer does not depend on earlier turns
+        if not self.answer_cache or session_memory.has_history():
+            return None, None, None
+
+        start = time.perf_counter()
+        # read before retrieval: the answer is not stored if the corpus changes meanwhile
+        generation = self.answer_cache.generation
+        query_embedding = await self.answer_cache.aembed(user_message)
+        cached = self.answer_cache.lookup(query_embedding, lookup_latency=time.perf_counter() - start)
+        return query_embedding, generation, cached
+
+    async def chat(self, user_message: str, session_id: str = DEFAULT_SESSION_ID):
         """Chat loop entrypoint"""
         try:
+            start = time.perf_counter()
+            session_memory = self.sessions.get(session_id)
+
+            query_embedding, cache_generation, cached = await self._lookup_answer_cache(user_message, session_memory)
+            if cached:
+                cached_message = AIMessage(content=cached["answer"])
+                self._remember_turn(session_memory, user_message, cached["answer"])
+                self._record_request("chat", start, [cached_message], answer_cache_hit=True)
+                return {
+                    "response": cached["answer"],
+                    "messages": [cached_message],
+                    "tool_calls": [],
+                    "context": cached["context"],
+                    "metadata": {
+                        "model": "gpt-4.1-mini",
+                        "total_messages": 1,
+                        "total_tool_calls": 0,
+                        "system_message_used": False,
+                        "answer_cache_hit": True,
+                        "answer_cache_similarity": cached["similarity"]
+                    },
+                    "status": "success"
+                }
 
-            force_message = "Use your RAG tool or web search tool to get context to asnwer my question"
-            sys_msg = SystemMessage(content=SYSTEM_PROMPT)
-            user_msg =  HumanMessage(content=user_message + " " + force_message)
-
-            inputs: AgentState = {
-                "query": user_message,
-                "current_messages": [sys_msg, user_msg],
-                "agent_memory": self.agent_memory,
-                "context": {},
-                "response": ""
-            }
+            inputs = self._build_inputs(user_message, session_memory)
 
             final_response = ""
             tool_calls = []
@@ -281,9 +428,14 @@ class LangGraphAgent():
                         if "context" in values:
                             final_context = values["context"]
 
-            # Append ReAct interaction to long-term agent memory
-            self.agent_memory.extend(final_current_messages)
+            # Append the exchange to the session memory (as one turn)
+            self._remember_turn(session_memory, user_message, final_response)
+
+            if query_embedding is not None and final_response:
+                self.answer_cache.store(query_embedding, final_response, final_context, time.perf_counter() - start,
+                                        cache_generation)
 
+            self._record_request("chat", start, final_current_messages)
             return {
                 "response": final_response or "I apologize, but I couldn't generate a response.",
                 "messages": final_current_messages,
@@ -302,7 +454,100 @@ class LangGraphAgent():
             raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
-    def reset_longer_term_memory(self):
-        self.agent_memory = []
+    async def chat_stream(self, user_message: str, session_id: str = DEFAULT_SESSION_ID):
+        """
+        Streaming chat entrypoint. Yields (event, data) tuples as the graph runs:
+        - ("token", {"content"}): LLM tokens of the agent node, as they arrive
+        - ("tool_start", {"name", "args", "id"}): the agent requested a tool
+        - ("tool_end", {"node", "content"}): a tool node returned its result
+        - ("final", {"response", "context"}): the complete answer
+        """
+        start = time.perf_counter()
+        session_memory = self.sessions.get(session_id)
+
+        query_embedding, cache_generation, cached = await self._lookup_answer_cache(user_message, session_memory)
+        if cached:
+            self._remember_turn(session_memory, user_message, cached["answer"])
+            self._record_request("chat_stream", start, [], answer_cache_hit=True)
+            yield "final", {"response": cached["answer"], "context": cached["context"], "answer_cache_hit": True}
+            return
+
+        inputs = self._build_inputs(user_message, session_memory)
+
+        final_response = ""
+        final_current_messages = []
+        final_context = {}
+
+        if not self.agent_graph:
+            raise HTTPException(status_code=500, detail="Agent graph not initialized")
+
+        async for mode, chunk in self.agent_graph.astream(inputs, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                if metadata.get("langgraph_node") == "agent" and message_chunk.content:
+                    yield "token", {"content": message_chunk.content}
+                continue
+
+            for node, values in chunk.items():
+                for msg in values.get("current_messages", []):
+                    final_current_messages.append(msg)
+                    if node == "agent":
+                        for call in getattr(msg, "tool_calls", None) or []:
+                            yield "tool_start", {"name": call["name"], "args": call["args"], "id": call["id"]}
+                    else:
+                        yield "tool_end", {"node": node, "content": msg.content}
+                if "response" in values:
+                    final_response = values["response"]
+                if "context" in values:
+                    final_context = values["context"]
+
+        # Append the exchange to the session memory (as one turn)
+        self._remember_turn(session_memory, user_message, final_response)
+
+        if query_embedding is not None and final_response:
+            self.answer_cache.store(query_embedding, final_response, final_context, time.perf_counter() - start,
+                                    cache_generation)
+
+        self._record_request("chat_stream", start, final_current_messages)
+        yield "final", {
+            "response": final_response or "I apologize, but I couldn't generate a response.",
+            "context": final_context
+        }
+
+    def _invalidate_answer_cache(self):
+        # cached answers may be based on documents that changed
+        if self.answer_cache:
+            self.answer_cache.invalidate()
+
+    def get_answer_cache_stats(self):
+        if not self.answer_cache:
+            return {"enabled": False}
+        return {"enabled": True, **self.answer_cache.stats()}
+
+    def reset_longer_term_memory(self, session_id: str = None):
+        if session_id is None:
+            self.sessions.clear_all()
+        else:
+            self.sessions.clear(session_id)
+
+    def upsert_documents(self, documents: List[Document]):
+        """Insert or replace knowledge base documents (by metadata["doc_id"]) without rebuilding the indexes"""
+        try:
+            stats = self.dbs_manager.upsert_documents(documents)
+            self.retrival_chains.registry.refresh_bm25()
+            self._invalidate_answer_cache()
+            return stats
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upsert documents: {str(e)}")
+
+    def delete_documents(self, doc_ids: List[str]):
+        """Delete knowledge base documents by their stable ID"""
+        try:
+            deleted = self.dbs_manager.delete_documents(doc_ids)
+            self.retrival_chains.registry.refresh_bm25()
+            self._invalidate_answer_cache()
+            return deleted
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete documents: {str(e)}")
 
 #Agent = LangGraphAgent(retriever_mode=RetrievalEnums.NAIVE, MODE="CERT", langchain_project_name="AIM-CERT-LANGGRAPH-NAIVE")
\ No newline at end of file
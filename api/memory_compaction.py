@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import List
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from prompts import MEMORY_SUMMARY_PROMPT
+from session_store import SessionMemory
+from utils import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationCompactor():
+    def __init__(self, llm, max_summary_tokens: int = 400):
+        '''
+        Folds the oldest turns of a session into its running summary, off the request path.
+
+        Compactions run as background tasks once a session exceeds its turn budget (see SessionMemory), so the
+        prompt of every call stays bounded (system prompt + summary + a few recent turns + the current turn)
+        however long the conversation gets.
+
+        Args:
+            llm: The chat model writing the summaries.
+            max_summary_tokens (int): The token budget of the summary.
+        '''
+        self.llm = llm
+        self.max_summary_tokens = max_summary_tokens
+        self._tasks = set()
+
+    def schedule(self, memory: SessionMemory):
+        """
+        Starts a compaction of the session in the background if one is due.
+        """
+        folded_turns = memory.start_compaction()
+        if folded_turns is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._compact(memory, folded_turns))
+        # keep a reference until the task is done
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _format_exchanges(turns: List[List[BaseMessage]]) -> str:
+        lines = []
+        for turn in turns:
+            for msg in turn:
+                role = "Parent" if isinstance(msg, HumanMessage) else "Coach"
+                lines.append(f"{role}: {msg.content}")
+        return "\n".join(lines)
+
+    async def _compact(self, memory: SessionMemory, folded_turns: List[List[BaseMessage]]):
+        summary = None
+        try:
+            prompt = MEMORY_SUMMARY_PROMPT.format(
+                max_words=int(self.max_summary_tokens * 0.75),
+                summary=memory.summary or "(none)",
+                exchanges=self._format_exchanges(folded_turns)
+            )
+            response = await self.llm.ainvoke(prompt)
+            summary = truncate_to_tokens(response.content.strip(), self.max_summary_tokens)
+        except Exception as e:
+            logger.warning("Conversation compaction failed, keeping the turns: %s", e)
+        finally:
+            memory.finish_compaction(folded_turns, summary)
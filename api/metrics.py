@@ -0,0 +1,178 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Latency buckets (seconds), from in-process lookups to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter():
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        '''
+        Monotonic counter with labels (Prometheus counter).
+        '''
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram():
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        '''
+        Cumulative histogram with labels (Prometheus histogram).
+        '''
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [bucket counts, sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry():
+    def __init__(self):
+        '''
+        In-process metrics registry rendered in the Prometheus text exposition format (see /api/metrics).
+        Metrics are per process: with several workers (see serve.py) each worker exposes its own series.
+        '''
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "agent_request_duration_seconds", "End-to-end agent request latency.", ["endpoint", "answer_cache_hit"])
+NODE_LATENCY = REGISTRY.histogram(
+    "agent_node_duration_seconds", "Latency of the companion-agent-graph nodes.", ["node"])
+RETRIEVAL_LATENCY = REGISTRY.histogram(
+    "retrieval_duration_seconds", "Latency of the RAG tool retrieval, per retrieval mode.", ["mode"])
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Latency of upstream calls (OpenAI, Cohere, Tavily, Qdrant).",
+    ["upstream", "operation", "outcome"])
+REACT_ITERATIONS = REGISTRY.histogram(
+    "agent_react_iterations", "ReAct iterations (agent node runs) per request.", buckets=COUNT_BUCKETS)
+TOOL_CALLS_PER_REQUEST = REGISTRY.histogram(
+    "agent_tool_calls_per_request", "Tool calls requested by the model per request.", buckets=COUNT_BUCKETS)
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "Tool calls requested by the model.", ["tool"])
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "LLM token usage.", ["model", "type"])
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    """
+    Times an upstream call into upstream_request_duration_seconds, labelled with its outcome (ok or error).
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream, operation=operation, outcome=outcome)
+
+
+def instrument_methods(obj, upstream: str, method_names: Sequence[str]):
+    """
+    Wraps the given methods of a client instance (e.g. a QdrantClient) with track_upstream.
+    """
+    for method_name in method_names:
+        method = getattr(obj, method_name, None)
+        if method is None:
+            continue
+
+        def timed(*args, _method=method, _operation=method_name, **kwargs):
+            with track_upstream(upstream, _operation):
+                return _method(*args, **kwargs)
+
+        setattr(obj, method_name, timed)
+    return obj
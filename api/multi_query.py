@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from typing import Any, List
+
+from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT, LineListOutputParser
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import PrivateAttr
+
+from rerank import get_candidate_id
+
+
+class CachedMultiQueryRetriever(BaseRetriever):
+    """
+    MultiQuery retrieval with cached query expansion and batched retrieval.
+
+    The LLM-generated variants of a question are cached per normalized question (LRU). All variants are
+    embedded in one batched request, searched together as a single batch (one matrix product with the NumPy
+    backend, one batch request with Qdrant) and the union is deduplicated by chunk ID. On a cache hit the
+    cost is close to a single retrieval.
+    """
+
+    vectorstore: VectorStore
+    llm_chain: Any
+    k: int = 3
+    include_original: bool = False
+    max_cache_entries: int = 1024
+
+    _variants_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def from_llm(cls, vectorstore: VectorStore, llm, k: int = 3, include_original: bool = False) -> "CachedMultiQueryRetriever":
+        llm_chain = DEFAULT_QUERY_PROMPT | llm | LineListOutputParser()
+        return cls(vectorstore=vectorstore, llm_chain=llm_chain, k=k, include_original=include_original)
+
+    def generate_queries(self, question: str, run_manager: CallbackManagerForRetrieverRun = None) -> List[str]:
+        key = " ".join(question.lower().split())
+        with self._lock:
+            variants = self._variants_cache.get(key)
+            if variants is not None:
+                self._variants_cache.move_to_end(key)
+
+        if variants is None:
+            config = {"callbacks": run_manager.get_child()} if run_manager else {}
+            variants = [line.strip() for line in self.llm_chain.invoke({"question": question}, config=config) if line.strip()]
+            with self._lock:
+                self._variants_cache[key] = variants
+                while len(self._variants_cache) > self.max_cache_entries:
+                    self._variants_cache.popitem(last=False)
+
+        queries = list(variants)
+        if self.include_original:
+            queries.append(question)
+        return queries
+
+    def _embed_queries(self, queries: List[str]):
+        embeddings = self.vectorstore.embeddings
+        # one batched request for all the variants (query embedding caches only send their misses)
+        embed_queries = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        return embed_queries(queries)
+
+    def _search_batch(self, query_vectors) -> List[List[Document]]:
+        if hasattr(self.vectorstore, "search_by_vectors"):
+            results = self.vectorstore.search_by_vectors(query_vectors, k=self.k)
+            return [[doc for doc, _ in pairs] for pairs in results]
+
+        from qdrant_client import models
+
+        # Qdrant: one batch request, payloads mapped back to documents
+        responses = self.vectorstore.client.query_batch_points(
+            collection_name=self.vectorstore.collection_name,
+            requests=[models.QueryRequest(query=list(vector), limit=self.k, with_payload=True) for vector in query_vectors]
+        )
+        return [
+            [
+                Document(
+                    page_content=point.payload.get("page_content", ""),
+                    metadata={**(point.payload.get("metadata") or {}), "_id": str(point.id)},
+                    id=str(point.id)
+                )
+                for point in response.points
+            ]
+            for response in responses
+        ]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        queries = self.generate_queries(query, run_manager)
+        if not queries:
+            return []
+
+        unique_docs, seen = [], set()
+        for docs in self._search_batch(self._embed_queries(queries)):
+            for doc in docs:
+                doc_key = get_candidate_id(doc)
+                if doc_key not in seen:
+                    seen.add(doc_key)
+                    unique_docs.append(doc)
+        return unique_docs
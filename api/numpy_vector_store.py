@@ -0,0 +1,231 @@
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+# float16 / int8 matrices are scored this many rows at a time, so only one block is ever converted to float32
+SCORE_BLOCK_ROWS = 2048
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process cosine-similarity vector store backed by one contiguous matrix of normalized embeddings.
+
+    Top-k is a single (batched) matrix product followed by argpartition. Vectors can be stored as float32,
+    float16 or int8 (symmetric per-row quantization) to cut memory per worker, and a read-only (memory-mapped)
+    matrix can be served as is (see from_arrays). Documents are kept as Qdrant-like payloads
+    ({"page_content", "metadata"}) so index snapshots are interchangeable between backends.
+
+    Writes build new arrays and swap them in atomically, so concurrent searches never see a partial update.
+    """
+
+    def __init__(self, embedding: Embeddings, dtype: str = "float32"):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Invalid dtype: {dtype} (expected one of {SUPPORTED_DTYPES})")
+        self.embedding = embedding
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        # (matrix, row scales or None, ids, payloads)
+        self._state = (None, None, [], [])
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self):
+        return len(self._state[2])
+
+    # ===============================
+    # Building
+    # ===============================
+
+    def _encode(self, vectors: np.ndarray):
+        vectors = _normalize(vectors)
+        if self.dtype == "float32":
+            return vectors, None
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def add_vectors(self, vectors, payloads: List[dict], ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Adds precomputed embeddings with their payloads ({"page_content", "metadata"}).
+        """
+        ids = [str(i) for i in ids] if ids else [uuid.uuid4().hex for _ in payloads]
+        matrix, scales = self._encode(np.asarray(vectors, dtype=np.float32).reshape(len(payloads), -1))
+
+        with self._lock:
+            old_matrix, old_scales, old_ids, old_payloads = self._state
+            if old_matrix is not None and len(old_ids):
+                matrix = np.concatenate([old_matrix, matrix])
+                scales = np.concatenate([old_scales, scales]) if scales is not None else None
+            self._state = (matrix, scales, old_ids + ids, old_payloads + list(payloads))
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self.embedding.embed_documents(texts)
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        return self.add_vectors(vectors, payloads, ids=ids)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, dtype: str = "float32", **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding=embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_arrays(cls, embedding: Embeddings, ids: List[str], vectors: np.ndarray, payloads: List[dict]) -> "NumpyVectorStore":
+        """
+        Serves already normalized float32 vectors (e.g. a memory-mapped snapshot matrix) without copying them.
+        """
+        store = cls(embedding=embedding, dtype="float32")
+        store._state = (vectors, None, list(ids), list(payloads))
+        return store
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        ids = {str(i) for i in ids}
+        return self._delete_where(lambda point_id, payload: point_id in ids)
+
+    def delete_by_metadata(self, key: str, values: List[Any]) -> bool:
+        """
+        Deletes the points whose metadata[key] is one of values (e.g. every chunk of a document by doc_id).
+        """
+        values = set(values)
+        return self._delete_where(lambda point_id, payload: payload["metadata"].get(key) in values)
+
+    def _delete_where(self, predicate) -> bool:
+        with self._lock:
+            matrix, scales, ids, payloads = self._state
+            keep = np.array([not predicate(point_id, payload) for point_id, payload in zip(ids, payloads)], dtype=bool)
+            if keep.all():
+                return False
+            self._state = (
+                np.ascontiguousarray(matrix[keep]),
+                scales[keep] if scales is not None else None,
+                [point_id for point_id, k in zip(ids, keep) if k],
+                [payload for payload, k in zip(payloads, keep) if k],
+            )
+        return True
+
+    def export_points(self):
+        """
+        Returns (ids, float32 vectors, payloads), e.g. to write an index snapshot.
+        """
+        matrix, scales, ids, payloads = self._state
+        if matrix is None:
+            return [], np.zeros((0, 0), dtype=np.float32), []
+        vectors = matrix.astype(np.float32)
+        if scales is not None:
+            vectors *= scales[:, None]
+        return list(ids), vectors, list(payloads)
+
+    # ===============================
+    # Searching
+    # ===============================
+
+    def filter_mask(self, filter: Optional[Dict[str, Any]], payloads: Optional[List[dict]] = None) -> Optional[np.ndarray]:
+        """
+        Builds a boolean mask of the points whose metadata match filter ({key: value or list of values}).
+        """
+        if not filter:
+            return None
+        payloads = self._state[3] if payloads is None else payloads
+        conditions = [(key, value if isinstance(value, (list, tuple, set)) else [value]) for key, value in filter.items()]
+        return np.array([
+            all(payload["metadata"].get(key) in allowed for key, allowed in conditions)
+            for payload in payloads
+        ], dtype=bool)
+
+    def search_by_vectors(self, query_vectors, k: int = 4, filter=None) -> List[List[Tuple[Document, float]]]:
+        """
+        Batched top-k search: one matrix product for all queries, then argpartition per query.
+
+        Args:
+            query_vectors: The query embeddings (n_queries x dim).
+            k (int): The number of results per query.
+            filter: A metadata filter dict or a precomputed boolean mask over the points.
+
+        Returns:
+            list: For each query, the (document, cosine similarity) pairs, best first.
+        """
+        matrix, scales, ids, payloads = self._state
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if matrix is None or not ids:
+            return [[] for _ in range(len(queries))]
+
+        scores = self._score(queries, matrix, scales)
+
+        mask = filter if isinstance(filter, np.ndarray) else self.filter_mask(filter, payloads)
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([
+                (self._to_document(ids[i], payloads[i]), float(row[i]))
+                for i in ordered if np.isfinite(row[i])
+            ])
+        return results
+
+    @staticmethod
+    def _score(queries: np.ndarray, matrix: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if scales is not None:
+            scores *= scales[None, :]
+        return scores
+
+    @staticmethod
+    def _to_document(point_id: str, payload: dict) -> Document:
+        return Document(page_content=payload["page_content"], metadata=payload["metadata"], id=point_id)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_by_vectors([self.embedding.embed_query(query)], k=k, filter=filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter=None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.search_by_vectors([embedding], k=k, filter=filter)[0]]
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def batch_similarity_search(self, queries: List[str], k: int = 4, filter=None) -> List[List[Document]]:
+        """
+        Embeds all queries in one request and searches them as a single batch.
+        """
+        # query embedding caches (see query_embedding_cache.py) only send their misses upstream
+        embed_queries = getattr(self.embedding, "embed_queries", self.embedding.embed_documents)
+        results = self.search_by_vectors(embed_queries(queries), k=k, filter=filter)
+        return [[doc for doc, _ in pairs] for pairs in results]
+
+    def _select_relevance_score_fn(self):
+        # cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
@@ -26,6 +26,20 @@ Positive Discipline General Guidence (do not use for literal replies, but to com
 
 """
 
+MEMORY_SUMMARY_PROMPT = """\
+You maintain a running summary of a conversation between a parent and a positive discipline coach.
+
+Update the current summary with the new exchanges below. Keep the facts that matter for future answers:
+the child's age and situation, the parent's concerns and goals, and the advice already given.
+Write at most {max_words} words, in plain prose, without greetings or commentary.
+
+Current summary:
+{summary}
+
+New exchanges:
+{exchanges}
+"""
+
 # NOTE:Prompt Template for RAG below was just prototype, not used in the final agent exactly
 
 from langchain.prompts import ChatPromptTemplate
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from singleflight import SingleFlight
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a query for embedding cache lookups (surrounding and repeated whitespace).
+    """
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache(Embeddings):
+    def __init__(self, embeddings: Embeddings, model_name: str, max_entries: int = 4096):
+        '''
+        In-process LRU cache of query embeddings, keyed by (model name, normalized text).
+
+        Wraps the embeddings model shared by every retriever, so within a request (ensemble branches embedding
+        the same question) and across requests (repeated questions) each distinct query is embedded at most once
+        while it stays in the cache. Concurrent misses of the same query are coalesced (see singleflight.py): the
+        first caller embeds it, the others wait for its result. Document embeddings are delegated to the wrapped
+        model unchanged.
+
+        Args:
+            embeddings (Embeddings): The wrapped embeddings model (e.g. the disk-cached OpenAIEmbeddings).
+            model_name (str): The embeddings model name, part of the cache key.
+            max_entries (int): The maximum number of cached query embeddings.
+        '''
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        # queries bypass the document disk cache when the wrapped model has one
+        self.query_embeddings = getattr(embeddings, "underlying_embeddings", embeddings)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, count_miss: bool = True):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def _set(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model_name, normalize_text(text))
+
+        def fetch():
+            self.misses += 1
+            embedding = self.query_embeddings.embed_query(text)
+            self._set(key, embedding)
+            return embedding
+
+        # concurrent ensemble branches often embed the same query
+        return self._flight.do(key, lambda: self._get(key, count_miss=False), fetch)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = (self.model_name, normalize_text(text))
+
+        async def fetch():
+            self.misses += 1
+            embedding = await self.query_embeddings.aembed_query(text)
+            self._set(key, embedding)
+            return embedding
+
+        return await self._flight.ado(key, lambda: self._get(key, count_miss=False), fetch)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, sending all the cache misses to the provider in one batched request.
+        """
+        keys = [(self.model_name, normalize_text(text)) for text in texts]
+        embeddings = [self._get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fetched = self.query_embeddings.embed_documents([texts[i] for i in missing])
+            for i, embedding in zip(missing, fetched):
+                embeddings[i] = embedding
+                self._set(keys[i], embedding)
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,143 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import PrivateAttr
+
+from metrics import track_upstream
+
+logger = logging.getLogger(__name__)
+
+# Pool running the upstream rerank calls, so callers can stop waiting once their deadline is reached
+_rerank_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rerank")
+
+
+def get_candidate_id(doc: Document) -> str:
+    """
+    Returns a stable ID for a rerank candidate: the vectorstore point ID when known, a content hash otherwise.
+    """
+    point_id = doc.id or doc.metadata.get("_id")
+    if point_id:
+        return str(point_id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class _RerankBatch():
+    def __init__(self):
+        self.candidates = {}            # candidate id -> text
+        self.scores = None              # candidate id -> relevance score
+        self.error = None
+        self.closed = False
+        self.done = threading.Event()
+
+
+class CachedRerankCompressor(BaseDocumentCompressor):
+    """
+    Rerank layer in front of a remote reranker (e.g. CohereRerank) for contextual compression.
+
+    - Relevance scores are cached by (query, candidate ID); only uncached candidates are sent upstream.
+    - Concurrent requests for the same query within batch_window_seconds are merged into one upstream call
+      (the rerank API scores one query per call, so requests are batched per query).
+    - If the upstream call misses deadline_seconds (or fails), the base retriever's ordering is returned.
+    """
+
+    reranker: Any
+    top_n: int = 3
+    deadline_seconds: float = 3.0
+    batch_window_seconds: float = 0.02
+    max_cache_entries: int = 10000
+
+    _cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _pending: Dict[str, _RerankBatch] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        if not documents:
+            return []
+
+        query_key = " ".join(query.split())
+        candidate_ids = [get_candidate_id(doc) for doc in documents]
+        scores = self._get_cached_scores(query_key, candidate_ids)
+
+        missing = {cid: doc.page_content for cid, doc in zip(candidate_ids, documents) if cid not in scores}
+        if missing:
+            fetched = self._fetch_scores(query_key, missing)
+            if fetched is None:
+                # deadline missed or upstream error: keep the base retriever's ordering
+                return list(documents)[:self.top_n]
+            scores.update({cid: fetched[cid] for cid in missing})
+
+        ranked = sorted(zip(documents, candidate_ids), key=lambda pair: scores[pair[1]], reverse=True)
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "relevance_score": scores[cid]}, id=doc.id)
+            for doc, cid in ranked[:self.top_n]
+        ]
+
+    def _get_cached_scores(self, query_key: str, candidate_ids) -> Dict[str, float]:
+        scores = {}
+        with self._lock:
+            for cid in candidate_ids:
+                score = self._cache.get((query_key, cid))
+                if score is not None:
+                    self._cache.move_to_end((query_key, cid))
+                    scores[cid] = score
+        return scores
+
+    def _store_scores(self, query_key: str, scores: Dict[str, float]):
+        with self._lock:
+            for cid, score in scores.items():
+                self._cache[(query_key, cid)] = score
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+
+    def _fetch_scores(self, query_key: str, missing: Dict[str, str]) -> Optional[Dict[str, float]]:
+        start = time.monotonic()
+
+        with self._lock:
+            batch = self._pending.get(query_key)
+            leader = batch is None or batch.closed
+            if leader:
+                batch = self._pending[query_key] = _RerankBatch()
+            batch.candidates.update(missing)
+
+        if leader:
+            # give concurrent requests for the same query a moment to join this batch
+            time.sleep(self.batch_window_seconds)
+            with self._lock:
+                batch.closed = True
+                if self._pending.get(query_key) is batch:
+                    del self._pending[query_key]
+            _rerank_executor.submit(self._run_batch, query_key, batch)
+
+        remaining = self.deadline_seconds - (time.monotonic() - start)
+        if not batch.done.wait(timeout=max(remaining, 0.0)):
+            logger.warning("Rerank deadline of %.1fs missed, falling back to retriever ordering", self.deadline_seconds)
+            return None
+        if batch.error is not None:
+            logger.warning("Rerank failed, falling back to retriever ordering: %s", batch.error)
+            return None
+        return batch.scores
+
+    def _run_batch(self, query_key: str, batch: _RerankBatch):
+        try:
+            candidate_ids = list(batch.candidates)
+            with track_upstream("cohere", "rerank"):
+                results = self.reranker.rerank(
+                    documents=[batch.candidates[cid] for cid in candidate_ids],
+                    query=query_key,
+                    top_n=len(candidate_ids)
+                )
+            batch.scores = {candidate_ids[r["index"]]: r["relevance_score"] for r in results}
+            # late results still fill the cache for the next requests
+            self._store_scores(query_key, batch.scores)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
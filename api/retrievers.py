@@ -1,16 +1,24 @@
 
+import threading
+from collections.abc import Mapping
 from operator import itemgetter
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain.retrievers.contextual_compression import ContextualCompressionRetriever
-from langchain_cohere import CohereRerank
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain.retrievers import ParentDocumentRetriever, EnsembleRetriever
+from langchain.retrievers import ParentDocumentRetriever
 from langsmith import traceable
+from ensemble import ConcurrentEnsembleRetriever
+from bm25 import BM25Index, SparseBM25Retriever
+from rerank import CachedRerankCompressor
+from multi_query import CachedMultiQueryRetriever
 
 
 def get_retrieval_chains_and_wrappers_for_evals(retrievers_config, loaded_data, rag_prompt, chat_model, MODE):
+    # evaluation-only dependencies, imported here to keep them off the serving startup path
+    from langchain_community.retrievers import BM25Retriever
+    from langchain_cohere import CohereRerank
+    from langchain.retrievers import EnsembleRetriever
+    from langchain.retrievers.multi_query import MultiQueryRetriever
 
     vectorstore = retrievers_config["base"]["vectorstore"]
     parent_document_vectorstore = retrievers_config["parent_document"]["vectorstore"]
@@ -147,114 +155,213 @@ def get_retrieval_chains_and_wrappers_for_evals(retrievers_config, loaded_data,
     return chains, wrappers  
 
 
-def get_retrieval_chains_and_wrappers(retrievers_config, loaded_data, chat_model, MODE):
-
-    vectorstore = retrievers_config["base"]["vectorstore"]
-    parent_document_vectorstore = retrievers_config["parent_document"]["vectorstore"]
-    in_memory_store = retrievers_config["parent_document"]["in_memory_store"]
-    child_splitter = retrievers_config["parent_document"]["child_splitter"]
-
-    # Create the retriever - base retrieval
-    base_retriever = vectorstore.as_retriever(search_kwargs={"k" : 3})
-
-    base_retrieval_chain = itemgetter("question") | base_retriever
-
-    # ===============================
-    # BM25 Retrieval
-    # ===============================
-    # Create the retriever - BM25 retrieval
-    bm25_retriever = BM25Retriever.from_documents(loaded_data, )
-
-    bm25_retrieval_chain =  itemgetter("question") | bm25_retriever
-
-    # ===============================
-    # Contextual Compression Retrieval
-    # ===============================
-    # Create the retriever - contextual compression retrieval
-    compressor = CohereRerank(model="rerank-v3.5")
-    compression_retriever = ContextualCompressionRetriever(
-        base_compressor=compressor, base_retriever=base_retriever
-    )
-
-    contextual_compression_retrieval_chain = itemgetter("question") | compression_retriever
-
-    # ===============================
-    # Multi-Query Retrieval
-    # ===============================
-    # Create the retriever - multi-query retrieval
-    multi_query_retriever = MultiQueryRetriever.from_llm(
-        retriever=base_retriever, llm=chat_model
-    )
-
-    multi_query_retrieval_chain = itemgetter("question") | multi_query_retriever
-
-    # Example of invoking the multi-query retrieval chain:
-    # ===============================
-    # Parent Document Retrieval
-    # ===============================
-
-    parent_document_retriever = ParentDocumentRetriever(
-        vectorstore = parent_document_vectorstore,
-        docstore=in_memory_store,
-        child_splitter=child_splitter,
-    )
-
-    parent_document_retriever.add_documents(loaded_data, ids=None)
-
-    parent_document_retrieval_chain = itemgetter("question") | parent_document_retriever
-
-    # ===============================
-    # Ensemble Retrieval
-    # ===============================
-    # Create the retriever - ensemble retrieval
-    retriever_list = [bm25_retriever, base_retriever, parent_document_retriever, compression_retriever, multi_query_retriever]
-    equal_weighting = [1/len(retriever_list)] * len(retriever_list)
-
-    ensemble_retriever = EnsembleRetriever(
-        retrievers=retriever_list, weights=equal_weighting
-    )
-
-    ensemble_retrieval_chain = itemgetter("question") | ensemble_retriever
-
-    # ===============================
-    # Create the chains and wrapers
-    # ===============================
-    chains = {"base_retrieval_chain": base_retrieval_chain,
-              "bm25_retrieval_chain": bm25_retrieval_chain,
-              "contextual_compression_retrieval_chain": contextual_compression_retrieval_chain,
-              "multi_query_retrieval_chain": multi_query_retrieval_chain,
-              "parent_document_retrieval_chain": parent_document_retrieval_chain,
-              "ensemble_retrieval_chain": ensemble_retrieval_chain}
-
-    @traceable(name=f"RAG base_retrieval_chain prod - {MODE}")
-    def run_base_retrieval_chain(question):
-        return base_retrieval_chain.invoke({"question": question})
-
-    @traceable(name=f"RAG bm25_retrieval_chain prod - {MODE}")
-    def run_bm25_retrieval_chain(question):
-        return bm25_retrieval_chain.invoke({"question": question})
-
-    @traceable(name=f"RAG contextual_compression_retrieval_chain prod - {MODE}")
-    def run_contextual_compression_retrieval_chain(question):
-        return contextual_compression_retrieval_chain.invoke({"question": question})
-
-    @traceable(name=f"RAG multi_query_retrieval_chain prod - {MODE}")
-    def run_multi_query_retrieval_chain(question):
-        return multi_query_retrieval_chain.invoke({"question": question})
-
-    @traceable(name=f"RAG parent_document_retrieval_chain prod - {MODE}")
-    def run_parent_document_retrieval_chain(question):
-        return parent_document_retrieval_chain.invoke({"question": question})
-
-    @traceable(name=f"RAG ensemble_retrieval_chain prod - {MODE}")
-    def run_ensemble_retrieval_chain(question):
-        return ensemble_retrieval_chain.invoke({"question": question})
-
-    wrappers = {"base_retrieval_chain": run_base_retrieval_chain,
-              "bm25_retrieval_chain": run_bm25_retrieval_chain,
-              "contextual_compression_retrieval_chain": run_contextual_compression_retrieval_chain,
-              "multi_query_retrieval_chain": run_multi_query_retrieval_chain,
-              "parent_document_retrieval_chain": run_parent_document_retrieval_chain,
-              "ensemble_retrieval_chain": run_ensemble_retrieval_chain}
-
-    return chains, wrappers  
+# ===============================
+# Lazy, mode-scoped retrievers (prod)
+# ===============================
+
+# Retrieval chain name -> retriever component serving it
+RETRIEVAL_CHAIN_COMPONENTS = {
+    "base_retrieval_chain": "base",
+    "bm25_retrieval_chain": "bm25",
+    "contextual_compression_retrieval_chain": "contextual_compression",
+    "multi_query_retrieval_chain": "multi_query",
+    "parent_document_retrieval_chain": "parent_document",
+    "ensemble_retrieval_chain": "ensemble",
+}
+
+
+def get_document_ids(documents):
+    '''
+    Returns the stable IDs (metadata["doc_id"]) of the documents, or None to let the retriever generate them.
+    '''
+    doc_ids = [doc.metadata.get("doc_id") for doc in documents]
+    return doc_ids if all(doc_ids) else None
+
+
+class RetrieverRegistry():
+    def __init__(self, retrievers_config, loaded_data, chat_model, base_k: int = 3):
+        '''
+        Builds retrievers on first use and shares the pieces modes have in common.
+
+        Every component is built at most once: the base retriever is reused by contextual compression,
+        multi-query and ensemble, and the ensemble reuses the other retrievers instead of building its own
+        copies. Nothing is built (and nothing is embedded) for modes that are never requested.
+
+        Args:
+            retrievers_config (dict): The vectorstores, docstore and prebuilt pieces (see LangGraphAgent).
+            loaded_data (list): The loaded corpus documents.
+            chat_model: The chat model used by the multi-query retriever.
+            base_k (int): The number of chunks returned by the base retriever.
+        '''
+        self.retrievers_config = retrievers_config
+        self.loaded_data = loaded_data
+        self.chat_model = chat_model
+        self.base_k = base_k
+        self._components = {}
+        self._lock = threading.RLock()
+        self._builders = {
+            "base": self._build_base,
+            "bm25": self._build_bm25,
+            "contextual_compression": self._build_contextual_compression,
+            "multi_query": self._build_multi_query,
+            "parent_document": self._build_parent_document,
+            "ensemble": self._build_ensemble,
+        }
+
+    def get(self, name: str):
+        '''
+        Returns the retriever component with the given name, building it (and its dependencies) on first use.
+        '''
+        with self._lock:
+            if name not in self._components:
+                if name not in self._builders:
+                    raise ValueError(f"Invalid retriever: {name}")
+                self._components[name] = self._builders[name]()
+            return self._components[name]
+
+    def built(self):
+        return list(self._components)
+
+    def refresh_bm25(self):
+        '''
+        Rebuilds the BM25 index from the (updated) documents, if BM25 has been built.
+        The index is swapped in place so the ensemble keeps pointing at the same retriever.
+        '''
+        with self._lock:
+            bm25_retriever = self._components.get("bm25")
+            if bm25_retriever is None:
+                return
+            index = bm25_retriever.index
+            bm25_retriever.index = BM25Index.from_documents(self._bm25_documents(), k1=index.k1, b=index.b)
+
+    def _base_vectorstore(self):
+        # the base vectorstore is either given or built on demand (see VectorStoresManager.get_base_vectorstore)
+        config = self.retrievers_config["base"]
+        if config.get("vectorstore") is not None:
+            return config["vectorstore"]
+        return config["get_vectorstore"]()
+
+    def _build_base(self):
+        return self._base_vectorstore().as_retriever(search_kwargs={"k" : self.base_k})
+
+    def _bm25_documents(self):
+        # BM25 indexes chunks when they are available, whole documents otherwise
+        return self.retrievers_config.get("bm25", {}).get("documents") or self.loaded_data
+
+    def _build_bm25(self):
+        prebuilt_bm25_retriever = self.retrievers_config.get("bm25", {}).get("retriever")
+        return prebuilt_bm25_retriever or SparseBM25Retriever.from_documents(self._bm25_documents())
+
+    def _build_contextual_compression(self):
+        # cached, per-query batched Cohere rerank with a deadline fallback (see rerank.py)
+        config = self.retrievers_config.get("contextual_compression", {})
+        reranker = config.get("reranker")
+        if reranker is None:
+            from langchain_cohere import CohereRerank
+            reranker = CohereRerank(model="rerank-v3.5")
+
+        compressor = CachedRerankCompressor(
+            reranker=reranker,
+            top_n=config.get("top_n", 3),
+            deadline_seconds=config.get("deadline_seconds", 3.0)
+        )
+        return ContextualCompressionRetriever(
+            base_compressor=compressor, base_retriever=self.get("base")
+        )
+
+    def _build_multi_query(self):
+        # cached query expansion + batched embedding and search (see multi_query.py)
+        return CachedMultiQueryRetriever.from_llm(
+            vectorstore=self._base_vectorstore(), llm=self.chat_model, k=self.base_k
+        )
+
+    def _build_parent_document(self):
+        config = self.retrievers_config["parent_document"]
+        parent_document_retriever = ParentDocumentRetriever(
+            vectorstore = config["vectorstore"],
+            docstore=config["in_memory_store"],
+            child_splitter=config["child_splitter"],
+        )
+
+        # Ingestion (and embedding of the child chunks) only happens when this mode is actually used
+        if not config.get("prepopulated", False):
+            if config.get("ingest_embeddings"):
+                # batched, resumable embedding of the child chunks (see ingestion.py)
+                config["ingest_embeddings"]()
+            parent_document_retriever.add_documents(self.loaded_data, ids=get_document_ids(self.loaded_data))
+
+        return parent_document_retriever
+
+    def _build_ensemble(self):
+        # Branches run concurrently under a per-request deadline (see ensemble.py)
+        config = self.retrievers_config.get("ensemble", {})
+        branch_names = ("bm25", "base", "parent_document", "contextual_compression", "multi_query")
+        equal_weighting = {name: 1/len(branch_names) for name in branch_names}
+
+        return ConcurrentEnsembleRetriever(
+            retrievers={name: self.get(name) for name in branch_names},
+            weights=config.get("weights", equal_weighting),
+            deadline_seconds=config.get("deadline_seconds", 5.0),
+            branch_timeouts=config.get("branch_timeouts", {"contextual_compression": 4.0, "multi_query": 4.0}),
+        )
+
+
+class LazyRetrievalChains(Mapping):
+    def __init__(self, registry: RetrieverRegistry, chain_names):
+        '''
+        Read-only mapping of retrieval chain name -> chain, building each chain on first access.
+        '''
+        self.registry = registry
+        self.chain_names = list(chain_names)
+        self._chains = {}
+
+    def __getitem__(self, chain_name):
+        if chain_name not in self.chain_names:
+            raise KeyError(chain_name)
+        if chain_name not in self._chains:
+            retriever = self.registry.get(RETRIEVAL_CHAIN_COMPONENTS[chain_name])
+            self._chains[chain_name] = itemgetter("question") | retriever
+        return self._chains[chain_name]
+
+    def __iter__(self):
+        return iter(self.chain_names)
+
+    def __len__(self):
+        return len(self.chain_names)
+
+
+def _make_retrieval_chain_wrapper(chains: LazyRetrievalChains, chain_name: str, MODE: str):
+
+    @traceable(name=f"RAG {chain_name} prod - {MODE}")
+    def run_retrieval_chain(question):
+        return chains[chain_name].invoke({"question": question})
+
+    return run_retrieval_chain
+
+
+def get_retrieval_chains_and_wrappers(retrievers_config, loaded_data, chat_model, MODE, modes=None):
+    '''
+    Returns the retrieval chains and their traced wrappers, keyed by retrieval chain name.
+
+    Retrievers are built on first use (see RetrieverRegistry) and only for the requested modes.
+
+    Args:
+        retrievers_config (dict): The vectorstores, docstore and prebuilt pieces (see LangGraphAgent).
+        loaded_data (list): The loaded corpus documents.
+        chat_model: The chat model used by the multi-query retriever.
+        MODE (str): The mode name used in the traces.
+        modes (list): The retrieval chain names to serve (RetrievalEnums values). Defaults to all of them.
+
+    Returns:
+        tuple: (chains, wrappers)
+    '''
+    chain_names = modes or list(RETRIEVAL_CHAIN_COMPONENTS)
+    for chain_name in chain_names:
+        if chain_name not in RETRIEVAL_CHAIN_COMPONENTS:
+            raise ValueError(f"Invalid retrieval mode: {chain_name}")
+
+    registry = RetrieverRegistry(retrievers_config, loaded_data, chat_model)
+    chains = LazyRetrievalChains(registry, chain_names)
+    wrappers = {chain_name: _make_retrieval_chain_wrapper(chains, chain_name, MODE) for chain_name in chain_names}
+
+    return chains, wrappers
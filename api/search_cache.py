@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for cache lookups (case and whitespace insensitive).
+    """
+    return " ".join(query.lower().split())
+
+
+class SearchCache():
+    def __init__(self, ttl_seconds: float = 900, max_entries: int = 1000):
+        '''
+        TTL cache for web search results with request coalescing (singleflight).
+
+        Values are stored already formatted. Concurrent lookups of the same missing key share a single
+        upstream call: the first caller fetches, the others wait for its result (see singleflight.py).
+        Failures are not cached.
+
+        Args:
+            ttl_seconds (float): The time after which a cached result expires.
+            max_entries (int): The maximum number of cached results (least recently used are evicted first).
+        '''
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    async def aget_or_fetch(self, key, fetch):
+        '''
+        Returns the cached value for key, or awaits fetch() once for all concurrent callers of the same key.
+
+        Args:
+            key: The cache key.
+            fetch: A coroutine function producing the value.
+        '''
+        async def fetch_and_store():
+            self.misses += 1
+            value = await fetch()
+            self.set(key, value)
+            return value
+
+        return await self._flight.ado(key, lambda: self._lookup(key), fetch_and_store)
+
+    def get_or_fetch(self, key, fetch):
+        '''
+        Synchronous counterpart of aget_or_fetch for thread-based callers.
+
+        Args:
+            key: The cache key.
+            fetch: A function producing the value.
+        '''
+        def fetch_and_store():
+            self.misses += 1
+            value = fetch()
+            self.set(key, value)
+            return value
+
+        return self._flight.do(key, lambda: self._lookup(key), fetch_and_store)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "coalesced": self._flight.coalesced}
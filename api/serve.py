@@ -0,0 +1,58 @@
+"""
+Multi-worker entry point for the API.
+
+    cd api && python serve.py --workers 4
+
+The retrieval index is built once, before any worker starts: the snapshot referenced by LATEST (or
+INDEX_SNAPSHOT_DIR) is reused, otherwise one is built here (see index_snapshot.py). Every worker then opens
+that same snapshot read-only. Vectors, BM25 arrays and the parent docstore are memory-mapped, so their pages
+are shared by all workers through the OS page cache instead of being loaded (and embedded) once per worker.
+
+Only per-request state is per process. Conversation memory and the answer cache are kept per worker, so
+clients should be routed to a stable worker (sticky sessions) when memory matters. Runtime document updates
+(/api/admin/documents) are disabled in this mode: rebuild the snapshot and restart instead.
+"""
+import os
+import argparse
+import logging
+
+import uvicorn
+
+from index_snapshot import resolve_snapshot_dir, build_index_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_shared_index() -> str:
+    """
+    Returns the snapshot every worker will serve, building it first if none exists yet.
+    """
+    snapshot_dir = resolve_snapshot_dir()
+    if snapshot_dir is None:
+        logger.info("No index snapshot found, building one before starting the workers")
+        snapshot_dir = build_index_snapshot()
+    return snapshot_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API with several workers sharing one read-only index.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot_dir = prepare_shared_index()
+
+    # Workers inherit the environment: pin the snapshot so they all load the same one even if LATEST moves
+    os.environ["INDEX_SNAPSHOT_DIR"] = snapshot_dir
+    # The NumPy backend searches the memory-mapped vectors in place (in-memory Qdrant copies them per worker)
+    os.environ.setdefault("VECTOR_BACKEND", "numpy")
+    os.environ["SERVE_WORKERS"] = str(args.workers)
+
+    logger.info("Serving snapshot %s with %d workers", snapshot_dir, args.workers)
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
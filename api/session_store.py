@@ -0,0 +1,135 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionMemory():
+    def __init__(self, max_turns: int = 5, keep_turns: int = 2):
+        '''
+        Conversation memory of one session: a running summary of older turns plus the most recent turns.
+
+        A turn is one complete exchange (the user question and the final AI answer), so a tool-call message
+        is never separated from its ToolMessages and tool results do not pile up in the prompt. Once more than
+        max_turns turns are kept, the oldest ones (all but keep_turns) are folded into the summary by a
+        ConversationCompactor (see memory_compaction.py). The summary therefore changes once every few turns
+        and, in between, new turns only append to the prompt prefix.
+
+        Args:
+            max_turns (int): The number of turns kept before compaction.
+            keep_turns (int): The number of recent turns kept verbatim by a compaction.
+        '''
+        self.max_turns = max_turns
+        self.keep_turns = keep_turns
+        self.turns = []
+        self.summary = ""
+        self.compacting = False
+        self.last_access = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_turn(self, messages: List[BaseMessage]):
+        if not messages:
+            return
+        with self._lock:
+            self.turns.append(list(messages))
+            # hard bound if compactions keep failing: the oldest turns are dropped
+            del self.turns[:max(0, len(self.turns) - 2 * self.max_turns)]
+
+    def has_history(self) -> bool:
+        with self._lock:
+            return bool(self.turns or self.summary)
+
+    def get_messages(self) -> List[BaseMessage]:
+        """
+        Returns the memory in prompt order: the summary (if any), then the recent turns, oldest first.
+        """
+        with self._lock:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] if self.summary else []
+            return messages + [msg for turn in self.turns for msg in turn]
+
+    def start_compaction(self) -> Optional[List[List[BaseMessage]]]:
+        """
+        Returns the turns to fold into the summary, or None if no compaction is due (or one is running).
+        """
+        with self._lock:
+            if self.compacting or len(self.turns) <= self.max_turns:
+                return None
+            self.compacting = True
+            return [list(turn) for turn in self.turns[:len(self.turns) - self.keep_turns]]
+
+    def finish_compaction(self, folded_turns: List[List[BaseMessage]], summary: Optional[str]):
+        """
+        Replaces the folded turns by the new summary (None when the compaction failed: nothing changes).
+        """
+        with self._lock:
+            self.compacting = False
+            if summary is None:
+                return
+            # turns may have been dropped meanwhile (hard bound): only remove the folded ones still present
+            folded_ids = {id(turn[0]) for turn in folded_turns}
+            self.turns = [turn for turn in self.turns if id(turn[0]) not in folded_ids]
+            self.summary = summary
+
+
+class SessionStore():
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600, max_turns: int = 5, keep_turns: int = 2):
+        '''
+        Per-session conversation memory with LRU and TTL eviction.
+
+        Memory stays bounded under sustained multi-user load: at most max_sessions sessions of at most
+        max_turns turns (plus a summary) each. Sessions idle for longer than ttl_seconds are dropped, and the least recently
+        used session is evicted when the store is full.
+
+        Args:
+            max_sessions (int): The maximum number of live sessions.
+            ttl_seconds (float): The idle time after which a session expires.
+            max_turns (int): The number of turns kept per session before compaction.
+            keep_turns (int): The number of recent turns kept verbatim by a compaction.
+        '''
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.keep_turns = keep_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionMemory:
+        '''
+        Returns the memory of a session, creating it if needed, and marks it as most recently used.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = SessionMemory(max_turns=self.max_turns, keep_turns=self.keep_turns)
+                self._sessions[session_id] = memory
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            memory.last_access = now
+            return memory
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear_all(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self, now: float):
+        # sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session_id, memory = next(iter(self._sessions.items()))
+            if now - memory.last_access <= self.ttl_seconds:
+                break
+            self._sessions.pop(session_id)
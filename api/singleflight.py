@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+
+class SingleFlight():
+    def __init__(self):
+        '''
+        Request coalescing (singleflight) for the caches of the request path (see search_cache.py,
+        query_embedding_cache.py).
+
+        Concurrent misses of the same key share a single upstream call: the first caller fetches, the others
+        wait for its result. The caller's lookup is checked first, and fetch is expected to store its result
+        in the cache. Failures are not cached.
+
+        An async fetch runs as a task owned by the group, not by the caller that started it: a cancelled caller
+        (e.g. a client disconnecting from a stream) stops waiting, but the fetch completes for the others.
+        '''
+        self._lock = threading.Lock()
+        self._tasks = {}                # key -> asyncio.Task (async callers)
+        self._events = {}               # key -> threading.Event (sync callers)
+
+        self.coalesced = 0
+
+    async def ado(self, key, lookup, fetch):
+        '''
+        Returns lookup(), or awaits fetch() once for all concurrent callers of the same key.
+
+        Args:
+            key: The cache key.
+            lookup: A function returning the cached value, or None.
+            fetch: A coroutine function producing (and caching) the value.
+        '''
+        value = lookup()
+        if value is not None:
+            return value
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        # shielded: cancelling this caller does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when nobody is waiting
+
+    def do(self, key, lookup, fetch):
+        '''
+        Synchronous counterpart of ado for thread-based callers.
+
+        Args:
+            key: The cache key.
+            lookup: A function returning the cached value, or None.
+            fetch: A function producing (and caching) the value.
+        '''
+        while True:
+            value = lookup()
+            if value is not None:
+                return value
+
+            with self._lock:
+                event = self._events.get(key)
+                leader = event is None
+                if leader:
+                    event = self._events[key] = threading.Event()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+
+            # another thread is fetching: wait for it, then re-check the cache (fetch again if it failed)
+            event.wait()
+
+        try:
+            return fetch()
+        finally:
+            with self._lock:
+                self._events.pop(key, None)
+            event.set()
@@ -0,0 +1,83 @@
+import time
+import threading
+from typing import Optional
+
+
+class StartupTracker():
+    def __init__(self):
+        '''
+        Tracks the phases of the agent initialization and their timings, for the readiness endpoint.
+
+        The state moves from "pending" through the tracked phases to "ready" (or "failed").
+        '''
+        self.phase = "pending"
+        self.timings = {}
+        self.error: Optional[str] = None
+        self.failed_phase: Optional[str] = None
+        self.ready = False
+        self.started = False
+        self._start = None
+        self._end = None
+        self._phase_start = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self) -> bool:
+        """
+        Marks the initialization as started. Returns False if it was already started.
+        """
+        with self._lock:
+            if self.started:
+                return False
+            self.started = True
+            self._start = time.monotonic()
+            self.phase = "starting"
+            return True
+
+    def begin(self, phase: str):
+        """
+        Starts a new phase; the previous one (if any) is closed and timed.
+        """
+        with self._lock:
+            self._close_phase()
+            self.phase = phase
+            self._phase_start = time.monotonic()
+
+    def _close_phase(self):
+        if self._phase_start is not None:
+            self.timings[self.phase] = round(time.monotonic() - self._phase_start, 3)
+            self._phase_start = None
+
+    def mark_ready(self):
+        with self._lock:
+            self._close_phase()
+            self.phase = "ready"
+            self.ready = True
+            self._end = time.monotonic()
+        self._done.set()
+
+    def mark_failed(self, error: Exception):
+        with self._lock:
+            self._close_phase()
+            self.failed_phase = self.phase
+            self.phase = "failed"
+            self._end = time.monotonic()
+            self.error = str(error)
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the initialization is ready or failed, or timeout seconds passed. Returns True if it ended.
+        """
+        return self._done.wait(timeout)
+
+    def status(self) -> dict:
+        end = self._end if self._end is not None else time.monotonic()
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "timings": dict(self.timings),
+            "elapsed_seconds": round(end - self._start, 3) if self._start is not None else 0.0,
+            "error": self.error,
+            "failed_phase": self.failed_phase
+        }
@@ -1,8 +1,11 @@
 import os
 from langchain_core.tools import Tool, tool
-from tavily import TavilyClient
+from tavily import TavilyClient, AsyncTavilyClient
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from search_cache import SearchCache, normalize_query
+from metrics import track_upstream
+from context_builder import build_context
 # Load environment variables
 load_dotenv()
 
@@ -12,10 +15,31 @@ load_dotenv()
 
 #tavily_tool = TavilySearchResults(max_results=5)
 tavily_client = TavilyClient(api_key = os.environ["TAVILY_API_KEY"])
+async_tavily_client = AsyncTavilyClient(api_key = os.environ["TAVILY_API_KEY"])
+
+# Formatted results are cached by (normalized query, max_results); identical concurrent searches share one call
+tavily_cache = SearchCache(
+    ttl_seconds=float(os.getenv("TAVILY_CACHE_TTL_SECONDS", "900")),
+    max_entries=int(os.getenv("TAVILY_CACHE_MAX_ENTRIES", "1000"))
+)
 
 def tavily_search(query: str, max_results: int = 5) -> str:
-    results = tavily_client.search(query=query, max_results=max_results)
+    def fetch():
+        with track_upstream("tavily", "search"):
+            results = tavily_client.search(query=query, max_results=max_results)
+        return format_tavily_results(results)
+
+    return tavily_cache.get_or_fetch((normalize_query(query), max_results), fetch)
 
+async def atavily_search(query: str, max_results: int = 5) -> str:
+    async def fetch():
+        with track_upstream("tavily", "search"):
+            results = await async_tavily_client.search(query=query, max_results=max_results)
+        return format_tavily_results(results)
+
+    return await tavily_cache.aget_or_fetch((normalize_query(query), max_results), fetch)
+
+def format_tavily_results(results: dict) -> str:
     if not results["results"]:
         return "No results found."
 
@@ -31,10 +55,14 @@ def tavily_search(query: str, max_results: int = 5) -> str:
 
 tavily_tool = Tool.from_function(
     func=tavily_search,
+    coroutine=atavily_search,
     name="tavily_search",
     description="Search the web for the latest information to build context related to the query"
 )
 
+# Token budget of the context returned by the RAG tool (local cl100k_base tokenizer)
+RAG_CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "3000"))
+
 class RAGInput(BaseModel):
     query: str
     retriever: object  # or use your specific retriever type if available
@@ -52,4 +80,5 @@ def custom_rag_tool(input: RAGInput) -> str:
     elif isinstance(docs, dict):
         return docs.get("answer", str(docs))  # Prefer 'answer' field if it exists
     else:
-        return str(docs)
\ No newline at end of file
+        # compact "[n] (source) text" passages within the token budget, best ranked first
+        return build_context(docs, max_tokens=RAG_CONTEXT_MAX_TOKENS)
\ No newline at end of file
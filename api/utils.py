@@ -1,6 +1,6 @@
 from pathlib import Path
-import os
-import pickle
+from functools import lru_cache
+import hashlib
 
 def get_parent_dir(file_path: str) -> Path:
     """
@@ -14,27 +14,60 @@ def get_parent_dir(file_path: str) -> Path:
     """
     return Path(file_path).resolve().parent.parent
 
-def data_file_exists(path: str, filename: str) -> bool:
+def hash_file(filepath, chunk_size: int = 1 << 20) -> str:
     """
-    Checks if a pickdata file file exists at the given path.
+    Computes the SHA-256 hex digest of a file's content.
 
     Args:
-        path (str): The directory path where the data file is located.
-        filename (str): The name of the data file.
+        filepath (str): The path to the file.
+        chunk_size (int): The number of bytes read at a time.
 
     Returns:
-        bool: True if the file exists, False otherwise.
+        str: The hex digest.
     """
-    full_path = os.path.join(path, filename)
-    return os.path.isfile(full_path)
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-def save_pickle(obj, filepath):
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # no tiktoken, or its encoding file cannot be downloaded (offline): fall back to the character estimate
+        return None
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the local cl100k_base tokenizer (about 4 characters per token without tiktoken).
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
     """
-    Saves an object to a pickle file.
+    Truncates a text to at most max_tokens tokens.
 
     Args:
-        obj: The object to save.
-        filepath (str): The path to the pickle file.
+        text (str): The text.
+        max_tokens (int): The maximum number of tokens kept.
+
+    Returns:
+        str: The truncated text.
     """
-    with open(filepath, 'wb') as f:
-        pickle.dump(obj, f)
\ No newline at end of file
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
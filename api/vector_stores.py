@@ -1,16 +1,99 @@
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_openai import ChatOpenAI
-from langchain_qdrant import Qdrant
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_qdrant import Qdrant
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_core.stores import InMemoryStore
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient, models
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils import get_parent_dir
+from numpy_vector_store import NumpyVectorStore
+from query_embedding_cache import QueryEmbeddingCache
+from ingestion import EmbeddingIngestionPipeline
+from compact_docstore import CompactDocStore
+from metrics import instrument_methods, track_upstream
+import os
+import threading
+
+
+# QdrantClient calls timed as "qdrant" upstream calls (see metrics.py)
+QDRANT_CLIENT_METHODS = ("query_points", "query_batch_points", "search", "search_batch", "scroll", "upsert", "delete")
+
+
+class TrackedEmbeddings(Embeddings):
+    """
+    Times the calls of an embeddings model as "openai" upstream calls (see metrics.py).
+
+    It wraps the model below the embedding caches, so only the texts actually sent to the API are timed.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        with track_upstream("openai", "embed_documents"):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with track_upstream("openai", "embed_query"):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        with track_upstream("openai", "embed_documents"):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        with track_upstream("openai", "embed_query"):
+            return await self.embeddings.aembed_query(text)
+
+
+def get_cached_embeddings_model(embeddings_model_name: str, cache_dir: str):
+    """
+    Wraps OpenAIEmbeddings with an on-disk, content-addressed embedding cache and a query embedding LRU cache.
+
+    Chunk embeddings are stored under cache_dir keyed by (embeddings model name, hash of the chunk text),
+    so only new or changed chunks reach the embeddings API. Both the base vectorstore and the
+    parent document child index share the same wrapped model, and therefore the same cache.
+    Query embeddings are kept in memory (see QueryEmbeddingCache), so every retriever sharing the
+    model embeds a given query at most once.
+
+    Args:
+        embeddings_model_name (str): The OpenAI embeddings model name (also used as the cache namespace).
+        cache_dir (str): The directory where the cached embeddings are stored.
+
+    Returns:
+        QueryEmbeddingCache: The cached embeddings model.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # timed below the caches: cache hits are not upstream calls
+    underlying_embeddings = TrackedEmbeddings(OpenAIEmbeddings(model=embeddings_model_name))
+    document_cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings,
+        LocalFileStore(cache_dir),
+        namespace=embeddings_model_name,
+        key_encoder="sha256"
+    )
+    return QueryEmbeddingCache(document_cached_embeddings, model_name=embeddings_model_name)
+
+
+def get_text_splitter(chunk_config):
+    """
+    Returns the splitter of the base chunks (None when chunking is disabled).
+    """
+    if not chunk_config["enabled"]:
+        return None
+    return RecursiveCharacterTextSplitter(
+        chunk_size = chunk_config["params"]["chunk_size"],
+        chunk_overlap = chunk_config["params"]["chunk_overlap"],
+        add_start_index = True  # character offsets, used to merge overlapping retrieved chunks
+    )
+
+
+def get_child_splitter():
+    """
+    Returns the splitter of the parent document child chunks.
+    """
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap = 200) # TODO: make this dynamic
 
 
 class VectorStoresManager():
@@ -19,83 +102,354 @@ class VectorStoresManager():
                 chunk_config = {"enabled": True, "params": {"chunk_size": 1500, "chunk_overlap": 250}},
                 embeddings_model_name = "text-embedding-3-small", 
                 chat_model = "gpt-4.1-mini",
-                collection_name = "Rag Loaded Data Baseline"):
+                collection_name = "Rag Loaded Data Baseline",
+                embeddings_cache_dir = None,
+                vector_backend = "qdrant",
+                vector_dtype = "float32",
+                ingestion_config = {"max_batch_tokens": 20000, "max_concurrency": 4},
+                embeddings_model = None):
 
         self.loaded_data = loaded_data
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
         self.MODE = MODE
         self.chunk_config = chunk_config
         self.embeddings_model_name = embeddings_model_name
-        self.embeddings_model = OpenAIEmbeddings(model=self.embeddings_model_name)
-        self.chat_model = ChatOpenAI(model=chat_model)
-        self.vectorstore = None
+        self.embeddings_cache_dir = embeddings_cache_dir or os.path.join(get_parent_dir(__file__), "data", "embeddings_cache")
+        # a prebuilt embeddings model (e.g. the local fakes of benchmark_retrieval.py) replaces the cached OpenAI one
+        self.embeddings_model = embeddings_model or get_cached_embeddings_model(self.embeddings_model_name, self.embeddings_cache_dir)
+        self.ingestion_pipeline = self._create_ingestion_pipeline(ingestion_config)
+        self.chat_model = ChatOpenAI(model=chat_model) if isinstance(chat_model, str) else chat_model
         self.parent_document_vectorstore = None
         self.in_memory_store = None
         self.child_splitter = None
+        self.text_splitter = None
 
         if MODE == "baseline":
             # ===============================
             # Baseline Retrieval
             # ===============================
-            if self.chunk_config["enabled"]:
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size = self.chunk_config["params"]["chunk_size"],
-                    chunk_overlap = self.chunk_config["params"]["chunk_overlap"]
-                )
-
-                self.loan_data_chunks = text_splitter.split_documents(self.loaded_data)
+            self.text_splitter = get_text_splitter(self.chunk_config)
+            if self.text_splitter:
+                self.loan_data_chunks = self.text_splitter.split_documents(self.loaded_data)
             else:
                 self.loan_data_chunks = self.loaded_data
 
-            self.vectorstore = Qdrant.from_documents(
-                self.loan_data_chunks,
-                self.embeddings_model,
-                location=":memory:",
-                collection_name="Rag Loaded Data Baseline"
-            )
+            self._init_base_vectorstore("Rag Loaded Data Baseline")
             
         elif MODE == "semantic":
             # ===============================
             # Semantic Retrieval
             # ===============================
+            from langchain_experimental.text_splitter import SemanticChunker
 
             semantic_chunker = SemanticChunker(
                 self.embeddings_model,
-                breakpoint_threshold_type="percentile"
-            )
-            semantic_data = semantic_chunker.split_documents(loaded_data)
-            
-            semantic_vectorstore = Qdrant.from_documents(
-                semantic_data,
-                self.embeddings_model,
-                location=":memory:",
-                collection_name="Rag Loaded Data Semantic"
+                breakpoint_threshold_type="percentile",
+                add_start_index=True
             )
-            self.vectorstore = semantic_vectorstore
+            self.text_splitter = semantic_chunker
+            self.loan_data_chunks = semantic_chunker.split_documents(loaded_data)
+
+            self._init_base_vectorstore("Rag Loaded Data Semantic")
         else:
             raise ValueError(f"Invalid mode: {MODE}")
 
         # Create the retriever - parent document retrieval
         self.parent_docs = self.loaded_data
-        self.child_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap = 200) # TODO: make this dynamic
+        self.child_splitter = get_child_splitter()
+
+        self.client_qdrant = None
 
-        self.client_qdrant = QdrantClient(location=":memory:")
+        if self.vector_backend == "numpy":
+            self.parent_document_vectorstore = NumpyVectorStore(embedding=self.embeddings_model, dtype=self.vector_dtype)
+        else:
+            from langchain_qdrant import QdrantVectorStore
+            from qdrant_client import QdrantClient, models
+
+            self.client_qdrant = instrument_methods(QdrantClient(location=":memory:"), "qdrant", QDRANT_CLIENT_METHODS)
 
-        self.client_qdrant.create_collection(
-            collection_name="full_documents",
-            vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
+            self.client_qdrant.create_collection(
+                collection_name="full_documents",
+                vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
+            )
+
+            self.parent_document_vectorstore = QdrantVectorStore(
+                collection_name="full_documents", 
+                embedding=self.embeddings_model, 
+                client=self.client_qdrant
+            )
+
+        # parents are kept as one compact buffer, not one Document object each (see compact_docstore.py)
+        self.in_memory_store = CompactDocStore()
+
+    def _init_base_vectorstore(self, collection_name = None, collection = None):
+        # The base vectorstore is built on first use (see get_base_vectorstore), from the snapshot collection
+        # if one is given. The lock is re-entrant: updates hold it while building the store
+        self.vectorstore = None
+        self.base_collection_name = collection_name
+        self._base_collection = collection
+        self._base_lock = threading.RLock()
+
+    def _create_ingestion_pipeline(self, ingestion_config):
+        return EmbeddingIngestionPipeline(
+            self.embeddings_model,
+            checkpoint_path=os.path.join(self.embeddings_cache_dir, f"{self.embeddings_model_name}.ingestion_checkpoint.json"),
+            **ingestion_config
         )
 
-        self.parent_document_vectorstore = QdrantVectorStore(
-            collection_name="full_documents", 
-            embedding=self.embeddings_model, 
-            client=self.client_qdrant
+    def ingest_embeddings(self, documents):
+        """
+        Embeds the documents through the batched, resumable ingestion pipeline (see ingestion.py).
+
+        The vectors land in the embedding cache, so the vector stores built (or extended) afterwards
+        read them back from disk instead of embedding the corpus in one synchronous pass.
+
+        Args:
+            documents (list[Document]): The chunks about to be added to a vector store.
+
+        Returns:
+            dict: The ingestion progress report.
+        """
+        return self.ingestion_pipeline.run([doc.page_content for doc in documents])
+
+    def ingest_child_embeddings(self):
+        """
+        Embeds the parent document child chunks before the parent document retriever ingests the corpus.
+        """
+        return self.ingest_embeddings(self.child_splitter.split_documents(self.loaded_data))
+
+    def _create_vectorstore(self, documents, collection_name):
+        self.ingest_embeddings(documents)
+
+        # Pluggable vector backend: in-memory Qdrant (default) or the in-process NumPy index
+        if self.vector_backend == "numpy":
+            return NumpyVectorStore.from_documents(documents, self.embeddings_model, dtype=self.vector_dtype)
+        if self.vector_backend == "qdrant":
+            from langchain_qdrant import Qdrant
+            vectorstore = Qdrant.from_documents(
+                documents,
+                self.embeddings_model,
+                location=":memory:",
+                collection_name=collection_name
+            )
+            instrument_methods(vectorstore.client, "qdrant", QDRANT_CLIENT_METHODS)
+            return vectorstore
+        raise ValueError(f"Invalid vector backend: {self.vector_backend}")
+
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, embeddings_cache_dir = None, vector_backend = "qdrant", vector_dtype = "float32"):
+        """
+        Restores the vector stores from a snapshot opened with index_snapshot.load_index_snapshot,
+        without calling the embeddings API for the corpus.
+
+        Args:
+            snapshot (dict): The loaded snapshot artifacts.
+            embeddings_cache_dir (str): The embedding cache directory (used for query-time embeddings).
+            vector_backend (str): "qdrant" (vectors uploaded to in-memory Qdrant) or "numpy"
+                (float32 vectors served straight from the memory-mapped snapshot).
+            vector_dtype (str): The NumPy backend storage type (float32, float16 or int8).
+
+        Returns:
+            VectorStoresManager: The restored manager, with its parent docstore already populated.
+        """
+        manifest = snapshot["manifest"]
+
+        manager = cls.__new__(cls)
+        manager.MODE = manifest["MODE"]
+        manager.chunk_config = manifest["chunk_config"]
+        manager.embeddings_model_name = manifest["embeddings_model_name"]
+        manager.embeddings_cache_dir = embeddings_cache_dir or os.path.join(get_parent_dir(__file__), "data", "embeddings_cache")
+        manager.embeddings_model = get_cached_embeddings_model(manager.embeddings_model_name, manager.embeddings_cache_dir)
+        manager.ingestion_pipeline = manager._create_ingestion_pipeline({"max_batch_tokens": 20000, "max_concurrency": 4})
+        manager.chat_model = None
+        manager.vector_backend = vector_backend
+        manager.vector_dtype = vector_dtype
+        manager._init_base_vectorstore("Rag Loaded Data Baseline", snapshot["collections"]["base"])
+
+        # The corpus is the memory-mapped parent docstore; the loaded data is a view decoding it on access
+        manager.in_memory_store = snapshot["docstore"]
+        manager.loaded_data = manager.in_memory_store.as_sequence()
+        manager.parent_docs = manager.loaded_data
+
+        base_payloads = snapshot["collections"]["base"][2]
+        manager.loan_data_chunks = [Document(page_content=p["page_content"], metadata=p["metadata"]) for p in base_payloads]
+        manager.text_splitter = get_text_splitter(manager.chunk_config)
+
+        manager.child_splitter = get_child_splitter()
+        manager.parent_document_vectorstore = manager._restore_vectorstore(snapshot["collections"]["full_documents"], "full_documents")
+        manager.client_qdrant = getattr(manager.parent_document_vectorstore, "client", None)
+
+        return manager
+
+    def _restore_vectorstore(self, collection, collection_name):
+        ids, vectors, payloads = collection
+
+        if self.vector_backend == "numpy":
+            if self.vector_dtype == "float32":
+                # no copy: the memory-mapped snapshot matrix is searched directly
+                return NumpyVectorStore.from_arrays(self.embeddings_model, ids, vectors, payloads)
+            vectorstore = NumpyVectorStore(embedding=self.embeddings_model, dtype=self.vector_dtype)
+            vectorstore.add_vectors(vectors, payloads, ids=ids)
+            return vectorstore
+
+        from langchain_qdrant import Qdrant, QdrantVectorStore
+
+        client = self._restore_collection(collection, collection_name)
+        if collection_name == "full_documents":
+            return QdrantVectorStore(collection_name=collection_name, embedding=self.embeddings_model, client=client)
+        return Qdrant(client=client, collection_name=collection_name, embeddings=self.embeddings_model)
+
+    @staticmethod
+    def _restore_collection(collection, collection_name):
+        from qdrant_client import QdrantClient, models
+
+        ids, vectors, payloads = collection
+
+        client = QdrantClient(location=":memory:")
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)
+        )
+        client.upload_collection(
+            collection_name=collection_name,
+            vectors=vectors,
+            payload=payloads,
+            ids=ids
         )
+        return instrument_methods(client, "qdrant", QDRANT_CLIENT_METHODS)
+
+    # ===============================
+    # Incremental updates
+    # ===============================
+
+    def upsert_documents(self, documents):
+        """
+        Inserts or replaces documents by their stable ID (metadata["doc_id"], see DataLoader).
 
-        self.in_memory_store = InMemoryStore()
+        Only the given documents are re-chunked and re-embedded (unchanged chunks hit the embedding cache).
+        The new chunks are embedded before the old entries are replaced, so a failed update changes nothing.
+        The base collection, the full_documents child collection and the parent docstore are updated, and
+        the loaded data and chunks are updated in place so the retrievers built on them (e.g. BM25) can be refreshed.
 
+        Args:
+            documents (list[Document]): The documents to upsert; each must carry metadata["doc_id"].
+
+        Returns:
+            dict: The number of upserted documents, base chunks and child chunks.
+        """
+        # updates and the lazy build of the base vectorstore must not interleave
+        with self._base_lock:
+            doc_ids = [doc.metadata["doc_id"] for doc in documents]
+            parent_index_populated = self._parent_index_populated()
+
+            base_chunks = self.text_splitter.split_documents(documents) if self.text_splitter else list(documents)
+            base_vectorstore = self._get_built_base_vectorstore()
+
+            child_chunks = []
+            # The parent index is only maintained once the parent document retriever has ingested the corpus,
+            # otherwise the upserted documents are picked up from the loaded data when it does
+            if parent_index_populated:
+                for doc_id, doc in zip(doc_ids, documents):
+                    for child in self.child_splitter.split_documents([doc]):
+                        child.metadata["doc_id"] = doc_id
+                        child_chunks.append(child)
+
+            # Embed first: if the embeddings API fails the current documents stay in place, and the
+            # replacement below only reads the embedding cache, so they are missing only briefly
+            if base_chunks and base_vectorstore is not None:
+                self.ingest_embeddings(base_chunks)
+            if child_chunks:
+                self.ingest_embeddings(child_chunks)
+
+            self.delete_documents(doc_ids)
+
+            if base_chunks and base_vectorstore is not None:
+                base_vectorstore.add_documents(base_chunks)
+            if parent_index_populated:
+                if child_chunks:
+                    self.parent_document_vectorstore.add_documents(child_chunks)
+                self.in_memory_store.mset(list(zip(doc_ids, documents)))
+
+            if isinstance(self.loaded_data, list):
+                self.loaded_data.extend(documents)
+            if self.loan_data_chunks is not self.loaded_data:
+                self.loan_data_chunks.extend(base_chunks)
+
+        return {"documents": len(documents), "base_chunks": len(base_chunks), "child_chunks": len(child_chunks)}
+
+    def delete_documents(self, doc_ids):
+        """
+        Deletes documents by their stable ID from both collections, the parent docstore and the loaded data.
+
+        Args:
+            doc_ids (list[str]): The stable IDs of the documents to delete.
+
+        Returns:
+            int: The number of documents removed from the loaded data.
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return 0
+
+        with self._base_lock:
+            deleted = set(doc_ids)
+            if isinstance(self.loaded_data, list):
+                remaining = [doc for doc in self.loaded_data if doc.metadata.get("doc_id") not in deleted]
+                removed = len(self.loaded_data) - len(remaining)
+                self.loaded_data[:] = remaining
+            else:
+                # the loaded data is a view over the docstore (see from_snapshot)
+                removed = sum(doc is not None for doc in self.in_memory_store.mget(doc_ids))
+
+            for vectorstore in (self._get_built_base_vectorstore(), self.parent_document_vectorstore):
+                if vectorstore is not None:
+                    self._delete_chunks(vectorstore, doc_ids)
+            self.in_memory_store.mdelete(doc_ids)
+
+            if self.loan_data_chunks is not self.loaded_data:
+                self.loan_data_chunks[:] = [chunk for chunk in self.loan_data_chunks if chunk.metadata.get("doc_id") not in deleted]
+
+        return removed
+
+    @staticmethod
+    def _delete_chunks(vectorstore, doc_ids):
+        if isinstance(vectorstore, NumpyVectorStore):
+            vectorstore.delete_by_metadata("doc_id", doc_ids)
+            return
+
+        from qdrant_client import models
+
+        doc_id_selector = models.FilterSelector(
+            filter=models.Filter(must=[
+                models.FieldCondition(key="metadata.doc_id", match=models.MatchAny(any=doc_ids))
+            ])
+        )
+        vectorstore.client.delete(collection_name=vectorstore.collection_name, points_selector=doc_id_selector)
+
+    def _parent_index_populated(self):
+        return next(self.in_memory_store.yield_keys(), None) is not None
 
     def get_base_vectorstore(self):
-        return self.vectorstore
+        """
+        Returns the base vectorstore, building it on first use: deployments that never query it (e.g. the
+        parent document retriever) do not embed or upload the base chunks.
+        """
+        with self._base_lock:
+            if self.vectorstore is None:
+                if self._base_collection is not None:
+                    self.vectorstore = self._restore_vectorstore(self._base_collection, self.base_collection_name)
+                else:
+                    self.vectorstore = self._create_vectorstore(self.loan_data_chunks, self.base_collection_name)
+            return self.vectorstore
+
+    def _get_built_base_vectorstore(self):
+        # The base vectorstore to keep in sync on updates; None while it is still to be built from the
+        # (updated) chunks. A snapshot collection is restored first, as it does not contain the updates
+        if self.vectorstore is None and self._base_collection is None:
+            return None
+        return self.get_base_vectorstore()
 
     def get_parent_document_vectorstore(self):
         return self.parent_document_vectorstore
@@ -67,6 +67,13 @@ export default function App() {
   const [showContextPopup, setShowContextPopup] = useState(false);
   const [selectedContext, setSelectedContext] = useState(null);
   
+  // Conversation session id (the agent keeps memory per session)
+  const sessionIdRef = useRef(
+    window.crypto && window.crypto.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
+
   // Ref for auto-scrolling to latest message
   const chatEndRef = useRef(null);
   const chatContainerRef = useRef(null);
@@ -122,7 +129,8 @@ export default function App() {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
-          user_message: currentUserMessage
+          user_message: currentUserMessage,
+          session_id: sessionIdRef.current
         }),
       });
       
@@ -160,7 +168,8 @@ export default function App() {
     try {
       await fetch("/api/clear-memory", {
         method: "POST",
-        headers: { "Content-Type": "application/json" }
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ session_id: sessionIdRef.current })
       });
     } catch (err) {
       console.error('Failed to clear agent memory:', err);